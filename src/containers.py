@@ -28,7 +28,7 @@ import time
 import uuid
 from dataclasses import dataclass, field
 from datetime import timedelta, datetime
-from typing import Any, Dict
+from typing import Any, Dict, List
 from uuid import uuid1
 
 from flask import jsonify, make_response, Response
@@ -50,6 +50,9 @@ class UserEvent:
         self.json: Dict[str, str | int | float | dict] = {}
         # initialize the event with the rid and current time
         self.add("rid", self.rid).add("time", time.time())
+        # the users whose todo_list the event was added to
+        self.receivers: List[str] = []
+        self.written = False
 
     def __call__(self, key: str, value: Any) -> None:
         # add a new key-value pair to the event data
@@ -60,6 +63,11 @@ class UserEvent:
             raise ValueError("data_base is None")
         # write the event data to the database
         self.data_base.insert_one(self.json)
+        self.written = True
+
+    def notify(self, user_id: str) -> None:
+        # record that the event was added to the user's todo_list
+        self.receivers.append(user_id)
 
     def add(self, key: str, value: Any) -> "UserEvent":
         # add a new key-value pair to the event data and return the event object
@@ -178,6 +186,9 @@ class User(Jelly):
 
     In this way, we have successfully created a new user and performed various operations on it, such as adding to-do items, changing passwords, verifying passwords and tokens, adding friends, etc.
     """
+    # the fields of a user, the ones of older documents that are no longer used go to `__dict__`
+    __slots__ = ('_id', 'hash_password', 'salt', 'user_id', 'user_name', 'todo_list', 'status', 'friend_dict',
+                 'groups_dict', 'email', 'language', 'avatar', 'bio', 'gender', '__dict__')
 
     def __init__(
         self,
@@ -281,6 +292,7 @@ class User(Jelly):
         :param ec: The event to add.
         """
         self.todo_list.append(ec.rid)
+        ec.notify(self.user_id)
 
     def add_fri_msg2todos(self, server, user_id, name, nick, msg_):
         """
@@ -366,6 +378,10 @@ class Group(Jelly):
     In this way, we have successfully created a new group, added members to it, set a group owner and administrator, and broadcasted a message to the group.
     """
 
+    # the fields of a group, the ones of older documents that are no longer used go to `__dict__`
+    __slots__ = ('_id', 'id', 'name', 'member_dict', 'owner', 'admin_list', 'member_settings', 'ban_dict',
+                 'group_settings', 'pin_list', '__dict__')
+
     # Define permission constants
     PERMISSION_OWNER = 0
     PERMISSION_ADMIN = 1
@@ -434,6 +450,25 @@ class Group(Jelly):
             return False
 
 
+@dataclass
+class RequestContext:
+    """
+    The state of a request shared by the main event and its auxiliary events, created once per request.
+    """
+
+    auth_success: bool = False
+    auth_data: Dict[str, Any] = field(default_factory=lambda: {"user_id": None})
+    # the language of the request, resolved by the first event that runs
+    lang: str | None = None
+    # a read-only snapshot of the user, taken when the language is resolved and reused by `BaseEvent.get_user`; use
+    # `update_user_data` to change it
+    user: User | None = None
+
+    @property
+    def user_id(self) -> str | None:
+        return self.auth_data["user_id"]
+
+
 @dataclass
 class Request:
     id: uuid.UUID = uuid.uuid4()
@@ -442,3 +477,4 @@ class Request:
     data: dict = field(default_factory=dict)
     path: str = "/"
     files: dict = field(default_factory=dict)
+    ctx: RequestContext | None = None
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : lmdb.py
+
+@Author     : hsn
+
+@Date       : 10/19/26 1:20 AM
+
+@Version    : 1.0.0
+"""
+import pickle
+import shutil
+import struct
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+import lmdb
+
+from src.db_adapter.base_dba import BaseCA, BaseDBA, Item
+from src.db_adapter.update_operators import apply_update
+from src.util.config_parser import ConfigParser
+
+# the longest key of lmdb (in the default build)
+MAX_KEY_SIZE = 511
+META_DB = b'__meta__'
+
+
+def _pack_number(value: int | float) -> bytes:
+    """
+    Pack a number into 8 bytes that sort like the numbers, so the time index can be walked as a range.
+    """
+    bits = struct.unpack('>Q', struct.pack('>d', float(value)))[0]
+    bits = bits ^ 0xFFFFFFFFFFFFFFFF if bits >> 63 else bits | (1 << 63)
+    return bits.to_bytes(8, 'big')
+
+
+def _key(value: Any) -> bytes | None:
+    """
+    Get the key of a value in a (sub-)database, None if the value can not be a key.
+    Numbers share one tag so that 1 and 1.0 meet in an index, like they do with `==`.
+    """
+    if isinstance(value, str):
+        key = b's' + value.encode('utf-8')
+    elif isinstance(value, (int, float)):
+        try:
+            key = b'n' + _pack_number(value)
+        except OverflowError:
+            return None
+    else:
+        return None
+    return key if len(key) <= MAX_KEY_SIZE else None
+
+
+def _encode(doc: Mapping[str, Any]) -> bytes:
+    """
+    Encode a document as a header of (field, offset, length) and the pickles of the fields, so a reader can unpickle
+    only the fields it needs.
+    """
+    fields, blobs, offset = [], [], 0
+    for k, v in doc.items():
+        blob = pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)
+        fields.append((k, offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+    header = pickle.dumps(fields, protocol=pickle.HIGHEST_PROTOCOL)
+    return len(header).to_bytes(4, 'big') + header + b''.join(blobs)
+
+
+def _decode(buf: bytes | memoryview, wanted: Callable[[str], bool] | None = None) -> dict:
+    """
+    Decode the fields of a document. `buf` can be a buffer into the memory map, it is only sliced, never copied.
+    :param buf: The encoded document.
+    :param wanted: Which fields to decode, all of them if None.
+    :return:
+    """
+    size = int.from_bytes(buf[:4], 'big')
+    base = 4 + size
+    return {k: pickle.loads(buf[base + offset:base + offset + length])
+            for k, offset, length in pickle.loads(buf[4:base]) if wanted is None or wanted(k)}
+
+
+class LmdbCA(BaseCA):
+    """
+    A collection in a named sub-database, keyed by `_id`. A document inserted without `_id` takes the value of the
+    natural key of the collection (`/keys`, such as the user_id of accounts) as its `_id`, so finding it by the natural
+    key is one lookup in the B+tree. Every indexed field has a sub-database of its own, with the `_id`s of the
+    documents as the duplicates of each value.
+    """
+
+    def __init__(self, global_config: ConfigParser, config: ConfigParser, collection: str, env: lmdb.Environment,
+                 meta: Any):
+        super().__init__(global_config, config, collection)
+        self.env = env
+        self.meta = meta
+        self.key_field: str | None = self.config.get_from_pointer(f"/keys/{collection}", None)
+        self.db = env.open_db(collection.encode('utf-8'))
+        self.indexes: Dict[str, Any] = {}
+        self._init_indexes(self.config.get_from_pointer("/indexes", ["user_id", "rid", "id", "time"]))
+
+    def _index_db(self, txn, field: str):
+        # in the write transaction that is open, opening it in a transaction of its own would wait for that one
+        return self.env.open_db(f'{self.collection}.{field}'.encode('utf-8'), txn=txn, dupsort=True)
+
+    def _init_indexes(self, fields: Iterable[str]):
+        """
+        Open the indexes of the fields, build the missing ones and drop the ones no longer configured.
+        """
+        fields = list(fields)
+        meta_key = f'{self.collection}.indexes'.encode('utf-8')
+        with self.env.begin(write=True) as txn:
+            built = pickle.loads(v) if (v := txn.get(meta_key, db=self.meta)) else []
+            for field in built:
+                if field not in fields:
+                    txn.drop(self._index_db(txn, field), delete=True)
+            for field in fields:
+                index = self._index_db(txn, field)
+                if field not in built:
+                    for k, v in txn.cursor(db=self.db):
+                        self._index_add(txn, index, k, _decode(v, field.__eq__))
+                self.indexes[field] = index
+            txn.put(meta_key, pickle.dumps(fields, protocol=pickle.HIGHEST_PROTOCOL), db=self.meta)
+
+    def _index_add(self, txn, index, _id: bytes, doc: Mapping[str, Any]):
+        for field, v in doc.items():
+            if (key := _key(v)) is not None:
+                txn.put(key, _id, db=index)
+
+    def _reindex(self, txn, _id: bytes, old: Mapping[str, Any] | None, new: Mapping[str, Any] | None):
+        for field, index in self.indexes.items():
+            old_key = _key(old[field]) if old is not None and field in old else None
+            new_key = _key(new[field]) if new is not None and field in new else None
+            if old_key == new_key:
+                continue
+            if old_key is not None:
+                txn.delete(old_key, _id, db=index)
+            if new_key is not None:
+                txn.put(new_key, _id, db=index)
+
+    def _indexed(self, txn, field: str, key: bytes) -> List[bytes]:
+        cursor = txn.cursor(db=self.indexes[field])
+        if not cursor.set_key(key):
+            return []
+        return [bytes(i) for i in cursor.iternext_dup()]
+
+    def _candidates(self, txn, filter_: Mapping[str, Any], limit: int) -> Iterable[Tuple[bytes, Any]]:
+        """
+        Get the documents that may match the filter: by `_id`, by the natural key, through an index, or a scan.
+        """
+        if '_id' in filter_:
+            if (key := _key(filter_['_id'])) is not None and (v := txn.get(key, db=self.db)) is not None:
+                yield key, v
+            return
+
+        if limit == 1 and self.key_field in filter_ and (key := _key(filter_[self.key_field])) is not None:
+            # the _id of the document is its natural key unless it was inserted with another one
+            if (v := txn.get(key, db=self.db)) is not None and \
+                    _decode(v, self.key_field.__eq__).get(self.key_field) == filter_[self.key_field]:
+                yield key, v
+                return
+
+        for field in self.indexes:
+            if field in filter_ and (key := _key(filter_[field])) is not None:
+                for _id in self._indexed(txn, field, key):
+                    if (v := txn.get(_id, db=self.db)) is not None:
+                        yield _id, v
+                return
+
+        yield from txn.cursor(db=self.db)
+
+    @staticmethod
+    def _match(v: Mapping[str, Any], filter_: Mapping[str, Any]) -> bool:
+        for f in filter_:
+            if f not in v:
+                return False
+            if v[f] != filter_[f]:
+                return False
+        return True
+
+    def _find(self, txn, filter_: Mapping[str, Any], limit: int = 0) -> Iterable[Tuple[bytes, Any]]:
+        count = 0
+        for _id, v in self._candidates(txn, filter_, limit):
+            if filter_ and not self._match(_decode(v, filter_.__contains__), filter_):
+                continue
+            yield _id, v
+            count += 1
+            if count == limit:
+                return
+
+    def find(self, filter_: Mapping[str, Any] | None = None, masking: Mapping[str, Any] | None = None, limit: int = 0,
+             sort_key: str = "") -> Iterable[Item]:
+        if filter_ is None:
+            filter_ = {}
+        wanted = (lambda k: masking.get(k, True)) if masking else None
+        # the buffers point into the memory map and are only valid in the transaction
+        with self.env.begin(db=self.db, buffers=True) as txn:
+            docs = [_decode(v, wanted) for _, v in self._find(txn, filter_, limit)]
+        for v in docs:
+            yield Item(v)
+
+    def find_many(self, key: str, values: Iterable[Any], masking=None) -> Iterable[Item]:
+        values = list(dict.fromkeys(values))
+        keys = [_key(i) for i in values]
+        if key not in self.indexes and key != '_id' or None in keys:
+            yield from super().find_many(key, values, masking)
+            return
+
+        wanted = (lambda k: masking.get(k, True)) if masking else None
+        docs = []
+        with self.env.begin(db=self.db, buffers=True) as txn:
+            for value, k in zip(values, keys):
+                if key == '_id':
+                    found = [(k, v)] if (v := txn.get(k, db=self.db)) is not None else []
+                else:
+                    found = self._find(txn, {key: value})
+                docs += [_decode(v, wanted) for _, v in found]
+        for v in docs:
+            yield Item(v)
+
+    def _insert(self, txn, item: Item | Mapping[str, Any]):
+        v = item
+        while isinstance(v, Item):
+            v = v.data
+        if "_id" not in v:
+            if self.key_field and (_id := v.get(self.key_field)) is not None and _key(_id) is not None:
+                if txn.get(_key(_id), db=self.db) is not None:
+                    raise ValueError(f'Duplicate {self.key_field} in {self.collection}: {_id!r}.')
+            else:
+                _id = uuid.uuid4().hex
+            v = {**v, "_id": _id}
+        if (key := _key(v["_id"])) is None:
+            raise ValueError(f'Unsupported _id: {v["_id"]!r}.')
+
+        old = txn.get(key, db=self.db)
+        self._reindex(txn, key, _decode(old, self.indexes.__contains__) if old is not None else None, v)
+        txn.put(key, _encode(v), db=self.db)
+
+    def insert_one(self, item: Item | Mapping[str, Any]):
+        with self.env.begin(write=True) as txn:
+            self._insert(txn, item)
+
+    def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        with self.env.begin(write=True) as txn:
+            for item in items:
+                self._insert(txn, item)
+
+    def _update(self, filter_: Mapping[str, Any], update: Mapping[str, Any], limit: int):
+        with self.env.begin(write=True) as txn:
+            for _id, v in list(self._find(txn, filter_, limit)):
+                old = _decode(v)
+                new = apply_update(old, update)
+                self._reindex(txn, _id, old, new)
+                txn.put(_id, _encode(new), db=self.db)
+
+    def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self._update(filter_, update, 1)
+
+    def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self._update(filter_, update, 0)
+
+    def _delete(self, txn, _id: bytes, v: Any):
+        self._reindex(txn, _id, _decode(v, self.indexes.__contains__), None)
+        txn.delete(_id, db=self.db)
+
+    def delete_one(self, filter_: Mapping[str, Any]):
+        with self.env.begin(write=True) as txn:
+            for _id, v in list(self._find(txn, filter_, 1)):
+                self._delete(txn, _id, v)
+
+    def delete_many(self, filter_: Mapping[str, Any]):
+        with self.env.begin(write=True) as txn:
+            for _id, v in list(self._find(txn, filter_)):
+                self._delete(txn, _id, v)
+
+    def set_ttl(self, field: str, seconds: float):
+        super().set_ttl(field, seconds)
+        if field not in self.indexes:
+            self._init_indexes([*self.indexes, field])
+
+    def delete_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        field, seconds = self.ttl
+        end = b'n' + _pack_number(time.time() - seconds)
+        with self.env.begin(write=True) as txn:
+            # the numbers of the index sort before the strings, walk them from the smallest to the cutoff
+            cursor = txn.cursor(db=self.indexes[field])
+            expired = []
+            if cursor.set_range(b'n'):
+                for k, _id in cursor.iternext():
+                    if k >= end or not k.startswith(b'n'):
+                        break
+                    expired.append(bytes(_id))
+            for _id in expired:
+                if (v := txn.get(_id, db=self.db)) is not None:
+                    self._delete(txn, _id, v)
+        return len(expired)
+
+    def save(self, item: Item) -> bool:
+        try:
+            self.insert_one(item)
+        except Exception:
+            return False
+        else:
+            return True
+
+
+class Lmdb(BaseDBA):
+    def __init__(self, config: ConfigParser):
+        super().__init__(config)
+        path_str = self.config.get_from_pointer("/path", None)
+        # lmdb always needs a file, a temporary one is used instead of memory
+        self.temp_dir = None if path_str else tempfile.mkdtemp()
+        path = Path(path_str or self.temp_dir) / self.config.get_from_pointer("/dir", "hcat.lmdb")
+        path.mkdir(parents=True, exist_ok=True)
+        self.env = lmdb.open(path.as_posix(),
+                             map_size=self.config.get_from_pointer("/map-size", 4096) * 1024 * 1024,
+                             max_dbs=self.config.get_from_pointer("/max-dbs", 64),
+                             max_readers=self.config.get_from_pointer("/max-readers", 126),
+                             sync=self.config.get_from_pointer("/sync", True),
+                             readahead=False)
+        self.meta = self.env.open_db(META_DB)
+        self.dbs: dict[str, LmdbCA] = {}
+
+    def close(self):
+        self.env.close()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def get_collection(self, collection: str) -> BaseCA:
+        if collection not in self.dbs:
+            self.dbs[collection] = LmdbCA(global_config=self.global_config, config=self.config,
+                                          collection=collection, env=self.env, meta=self.meta)
+        return self.dbs[collection]
@@ -22,69 +22,299 @@
 
 @Version    : 1.0.0
 """
-from typing import Mapping, Any, Iterable
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Mapping, Any, Iterable, List, Tuple
 
-from pymongo import MongoClient
+from pymongo import ASCENDING, AsyncMongoClient, MongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import OperationFailure
 
-from src.db_adapter.base_dba import BaseCA, BaseDBA, Item
+from src.db_adapter.base_dba import AsyncBaseCA, BaseCA, BaseDBA, Item
 from src.util.config_parser import ConfigParser
 
+# config keys under /db/adapters/Mongo => keyword arguments of `MongoClient`
+CLIENT_OPTIONS = {
+    'max-pool-size': 'maxPoolSize',
+    'min-pool-size': 'minPoolSize',
+    'max-idle-time': 'maxIdleTimeMS',
+    'connect-timeout': 'connectTimeoutMS',
+    'socket-timeout': 'socketTimeoutMS',
+    'server-selection-timeout': 'serverSelectionTimeoutMS',
+    'wait-queue-timeout': 'waitQueueTimeoutMS',
+    'compressors': 'compressors',
+    'read-preference': 'readPreference',
+    'retry-writes': 'retryWrites',
+}
+WRITE_CONCERN_OPTIONS = {
+    'w': 'w',
+    'journal': 'journal',
+    'timeout': 'wTimeoutMS',
+}
+
+# the indexes ensured when a collection is opened, collection => [(keys, options)]
+INDEXES = {
+    'account': [([('user_id', ASCENDING)], {'unique': True})],
+    'group': [([('id', ASCENDING)], {'unique': True})],
+    'event': [
+        # not unique, the request and the agreement of joining a group share their rid
+        ([('rid', ASCENDING)], {}),
+        # the lookups of `Recall`
+        ([('friend_id', ASCENDING), ('rid', ASCENDING)], {}),
+        ([('user_id', ASCENDING), ('rid', ASCENDING)], {}),
+    ],
+}
+
+# the date a document expires at, set when the collection has a TTL since Mongo's TTL indexes only work on dates
+EXPIRE_AT = '_expire_at'
+
 
 class MongoCA(BaseCA):
 
     def __init__(self, global_config: ConfigParser, config: ConfigParser, collection: str, db: Database):
         super().__init__(global_config=global_config, config=config, collection=collection)
         self._collection: Collection = db[collection]
+        self.logger = logging.getLogger(__name__)
+
+    def ensure_indexes(self, indexes: Iterable[Tuple[list, dict]]) -> List[Tuple[str, float | None]]:
+        """
+        Create the indexes that do not exist yet.
+        An index the server refuses (e.g. the user has no createIndex permission) is logged and skipped.
+        :param indexes: The keys and options of the indexes, as passed to `create_index`.
+        :return: The name of every index and the seconds it took to build, None if it already existed.
+        """
+        try:
+            existing = self._collection.index_information()
+        except OperationFailure as err:
+            self.logger.warning(f'Failed to list the indexes of {self.collection}: {err}')
+            existing = {}
+        report = []
+        for keys, options in indexes:
+            name = options.get('name') or '_'.join(f'{k}_{d}' for k, d in keys)
+            if name in existing:
+                if existing[name].get('unique', False) == options.get('unique', False):
+                    report.append((name, None))
+                    continue
+                # built with another uniqueness, such as the unique rid of the events before
+                self.logger.info(f'Rebuilding the index {self.collection}.{name}.')
+            start = time.perf_counter()
+            try:
+                if name in existing:
+                    self._collection.drop_index(name)
+                self._collection.create_index(keys, **options)
+            except OperationFailure as err:
+                self.logger.warning(f'Failed to create the index {self.collection}.{name}: {err}')
+                continue
+            report.append((name, time.perf_counter() - start))
+        return report
+
+    def set_ttl(self, field: str, seconds: float):
+        super().set_ttl(field, seconds)
+        # the documents still expire without the indexes, through `delete_expired`
+        if self.config.get_from_pointer('/ensure-indexes', True):
+            self.ensure_indexes([([(EXPIRE_AT, ASCENDING)], {'expireAfterSeconds': 0}), ([(field, ASCENDING)], {})])
+
+    def delete_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        field, seconds = self.ttl
+        # the TTL monitor of Mongo removes the documents with `EXPIRE_AT` by itself, this catches the ones written
+        # without it, through the index of the field
+        return self._collection.delete_many({field: {'$lt': time.time() - seconds}}).deleted_count
+
+    def _stamp(self, v: Mapping[str, Any]) -> Mapping[str, Any]:
+        if self.ttl is not None and isinstance(t := v.get(self.ttl[0]), (int, float)):
+            return {**v, EXPIRE_AT: datetime.fromtimestamp(t + self.ttl[1], tz=timezone.utc)}
+        return v
+
+    def _projection(self, masking: Mapping[str, Any] | None) -> Mapping[str, Any] | None:
+        # hide `EXPIRE_AT`, unless the masking only includes fields (then it is left out anyway)
+        if self.ttl is None:
+            return masking
+        if not masking:
+            return {EXPIRE_AT: 0}
+        if any(v for k, v in masking.items() if k != '_id'):
+            return masking
+        return {**masking, EXPIRE_AT: 0}
 
     def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
         self._collection.update_one(filter_, update)
 
+    def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self._collection.update_many(filter_, update)
+
     def delete_one(self, filter_: Mapping[str, Any]):
         self._collection.delete_one(filter_)
 
+    def delete_many(self, filter_: Mapping[str, Any]):
+        self._collection.delete_many(filter_)
+
     def save(self, item: Item) -> bool:
         return self._collection.save(item.data)
 
     def find(self, filter_: Mapping[str, Any], masking=None, limit: int = 0,
              sort_key: str = "") -> Iterable[Item]:
-        rt = self._collection.find(filter_ if filter_ else {}, masking).limit(limit)
+        rt = self._collection.find(filter_ if filter_ else {}, self._projection(masking)).limit(limit)
         if sort_key:
             rt = rt.sort(sort_key)
         return rt
 
     def insert_one(self, item: Item | Mapping[str, Any]):
         v = item
-        while isinstance(item, Item):
-            v = item.data
+        while isinstance(v, Item):
+            v = v.data
+
+        self._collection.insert_one(self._stamp(v))
 
-        self._collection.insert_one(v)
+    def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        docs = [self._stamp(i.data if isinstance(i, Item) else i) for i in items]
+        if docs:
+            self._collection.insert_many(docs, ordered=False)
+
+    def find_many(self, key: str, values: Iterable[Any], masking=None) -> Iterable[Item]:
+        return (Item(i) for i in self._collection.find({key: {'$in': list(values)}}, self._projection(masking)))
 
     def find_one(self,
                  filter_: Mapping[str, Any],
                  masking=None) -> (Item | None):
-        i = self._collection.find_one(filter_, masking)
+        i = self._collection.find_one(filter_, self._projection(masking))
 
         if i is None:
             return Item(None)
         return Item(i)
 
 
+class AsyncMongoCA(AsyncBaseCA):
+    """
+    A collection on the async driver of pymongo, nothing blocks the loop while waiting for the server.
+    The TTL (and so `_stamp` and `_projection`) is the one of the sync collection.
+    """
+
+    def __init__(self, ca: MongoCA, mongo: 'Mongo'):
+        super().__init__(ca.collection)
+        self.ca = ca
+        self.mongo = mongo
+
+    @property
+    def _collection(self) -> AsyncCollection:
+        return self.mongo.get_async_db()[self.collection]
+
+    async def find(self, filter_: Mapping[str, Any] | None = None, masking: Mapping[str, Any] | None = None,
+                   limit: int = 0, sort_key: str = "") -> List[Item]:
+        cursor = self._collection.find(filter_ if filter_ else {}, self.ca._projection(masking)).limit(limit)
+        if sort_key:
+            cursor = cursor.sort(sort_key)
+        return [Item(i) async for i in cursor]
+
+    async def find_one(self, filter_: Mapping[str, Any], masking=None) -> (Item | None):
+        return Item(await self._collection.find_one(filter_, self.ca._projection(masking)))
+
+    async def find_many(self, key: str, values: Iterable[Any], masking=None) -> List[Item]:
+        return [Item(i) async for i in self._collection.find({key: {'$in': list(values)}},
+                                                            self.ca._projection(masking))]
+
+    async def insert_one(self, item: Item | Mapping[str, Any]):
+        v = item
+        while isinstance(v, Item):
+            v = v.data
+        await self._collection.insert_one(self.ca._stamp(v))
+
+    async def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        docs = [self.ca._stamp(i.data if isinstance(i, Item) else i) for i in items]
+        if docs:
+            await self._collection.insert_many(docs, ordered=False)
+
+    async def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        await self._collection.update_one(filter_, update)
+
+    async def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        await self._collection.update_many(filter_, update)
+
+    async def delete_one(self, filter_: Mapping[str, Any]):
+        await self._collection.delete_one(filter_)
+
+    async def delete_many(self, filter_: Mapping[str, Any]):
+        await self._collection.delete_many(filter_)
+
+
 class Mongo(BaseDBA):
     def __init__(self, config: ConfigParser):
         super().__init__(config)
         self.collections = {}
 
+        # one client (and connection pool) shared by all collections
+        self.client = MongoClient(host=self.config['host'], port=self.config['port'], **self._client_options())
+        self.db: Database[Mapping[str, Any] | Any] = self.client[self.config['db']]
+        # an async client can only be used on one event loop, loop => client
+        self.async_clients: dict[asyncio.AbstractEventLoop, AsyncMongoClient] = {}
+        self.async_collections: dict[str, AsyncMongoCA] = {}
+        self._async_lock = threading.Lock()
+
+        self.logger = logging.getLogger(__name__)
+        # (collection, index, seconds to build or None if it existed)
+        self.index_report: List[Tuple[str, str, float | None]] = []
+
+    def _client_options(self) -> dict:
+        options = {v: self.config[k] for k, v in CLIENT_OPTIONS.items() if self.config[k] is not None}
+        write_concern = self.config['write-concern'] or {}
+        options.update({v: write_concern[k]
+                        for k, v in WRITE_CONCERN_OPTIONS.items() if write_concern.get(k) is not None})
+        return options
+
+    def get_async_db(self) -> AsyncDatabase:
+        """
+        Get the database on the async client of the running event loop.
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            if (client := self.async_clients.get(loop)) is None:
+                client = self.async_clients[loop] = AsyncMongoClient(host=self.config['host'], port=self.config['port'],
+                                                                     **self._client_options())
+        return client[self.config['db']]
+
     def close(self):
-        pass
+        self.client.close()
+        self.collections.clear()
+        with self._async_lock:
+            for loop, client in self.async_clients.items():
+                # the client has to be closed on its own loop, the ones of stopped loops are left to the GC
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(client.close(), loop)
+            self.async_clients.clear()
+            self.async_collections.clear()
+
+    def get_async_collection(self, collection: str) -> AsyncBaseCA:
+        if collection not in self.async_collections:
+            self.async_collections[collection] = AsyncMongoCA(self.get_collection(collection), self)
+        return self.async_collections[collection]
 
     def get_collection(self, collection: str) -> BaseCA:
         if collection in self.collections:
             return self.collections[collection]
         else:
-            db: Database[Mapping[str, Any] | Any] = MongoClient(host=self.config['host'], port=self.config['port'])[
-                self.config['db']]
-            ca = MongoCA(global_config=self.global_config, config=self.config, collection=collection, db=db)
+            ca = MongoCA(global_config=self.global_config, config=self.config, collection=collection, db=self.db)
+            if self.config.get_from_pointer('/ensure-indexes', True):
+                self._ensure_indexes(ca)
             self.collections[collection] = ca
             return ca
+
+    def _ensure_indexes(self, ca: MongoCA):
+        try:
+            report = ca.ensure_indexes(INDEXES.get(ca.collection, []))
+        except Exception as err:
+            # e.g. a unique index over duplicated values, the server still works without it
+            self.logger.error(f'Failed to ensure the indexes of {ca.collection}: {err}')
+            return
+        for name, seconds in report:
+            self.index_report.append((ca.collection, name, seconds))
+            if seconds is None:
+                self.logger.info(f'Index {ca.collection}.{name} exists.')
+            else:
+                self.logger.info(f'Index {ca.collection}.{name} built in {seconds * 1000:.1f} ms.')
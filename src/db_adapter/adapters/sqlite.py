@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : sqlite.py
+
+@Author     : hsn
+
+@Date       : 10/19/26 0:12 AM
+
+@Version    : 1.0.0
+"""
+import contextlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, List, Mapping, Tuple
+
+from src.db_adapter.base_dba import BaseCA, BaseDBA, Item
+from src.db_adapter.update_operators import apply_update
+from src.util.config_parser import ConfigParser
+
+# the most values bound to one statement
+MAX_VARIABLES = 500
+
+
+def _dumps(v: Mapping[str, Any]) -> str:
+    return json.dumps(v, ensure_ascii=False, separators=(',', ':'))
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _column(field: str) -> str:
+    return _quote(f'f_{field}')
+
+
+def _json_path(field: str) -> str:
+    return '$."' + field.replace('"', '\\"') + '"'
+
+
+def _condition(field: str, value: Any) -> Tuple[str, list] | None:
+    """
+    Get the SQL condition of `field == value` on the generated column of the field, None if it can not be one.
+    The json type is checked for strings, so objects (which are extracted as json text) never match them.
+    """
+    if isinstance(value, str):
+        return f'{_column(field)} = ? AND json_type(doc, ?) = \'text\'', [value, _json_path(field)]
+    if isinstance(value, (int, float)):
+        # json true/false are extracted as 1/0, like True == 1 in python
+        return f'{_column(field)} = ?', [value]
+    return None
+
+
+class _ConnectionPool:
+    """
+    One connection per thread, all of them on the same database file.
+    WAL lets the readers of other threads go on while one thread writes. A database in memory can not be shared by
+    connections, it is used through one connection under a lock instead.
+    """
+
+    def __init__(self, path: Path | None, synchronous: str, busy_timeout: float, cached_statements: int):
+        self.path = path
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.connections: List[sqlite3.Connection] = []
+        self.lock = threading.RLock()
+        self.shared = self._connect() if path is None else None
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit, the transactions are started explicitly. The statements are prepared once per connection and
+        # kept in its statement cache, which is why the SQL of a collection never changes.
+        conn = sqlite3.connect(':memory:' if self.path is None else self.path.as_posix(), isolation_level=None,
+                               check_same_thread=False, cached_statements=self.cached_statements)
+        if self.path is not None:
+            conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterable[sqlite3.Connection]:
+        if self.shared is not None:
+            with self.lock:
+                yield self.shared
+            return
+        if (conn := getattr(self.local, 'conn', None)) is None:
+            conn = self.local.conn = self._connect()
+        yield conn
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterable[sqlite3.Connection]:
+        """
+        A write transaction, the write lock of the database is taken at the beginning so reads in it are not stale.
+        """
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            else:
+                conn.execute('COMMIT')
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
+
+class SqliteCA(BaseCA):
+    """
+    A collection in a table: the `_id` and the document as json.
+    The indexed fields are generated columns extracted from the json, `find` uses their indexes when the filter covers
+    them. The other filters, and the update operators, are handled in python.
+    """
+
+    def __init__(self, global_config: ConfigParser, config: ConfigParser, collection: str, pool: _ConnectionPool):
+        super().__init__(global_config, config, collection)
+        self.logger = logging.getLogger(__name__)
+        self.pool = pool
+        self.table = _quote(collection)
+        self.indexes: List[str] = []
+
+        with self.pool.transaction() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} (_id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+        for field in self.config.get_from_pointer("/indexes", ["user_id", "rid", "id", "time"]):
+            self._ensure_index(field)
+
+    def _ensure_index(self, field: str):
+        with self.pool.transaction() as conn:
+            columns = {i[1] for i in conn.execute(f'PRAGMA table_xinfo({self.table})')}
+            if f'f_{field}' not in columns:
+                conn.execute(f'ALTER TABLE {self.table} ADD COLUMN {_column(field)} '
+                             f'GENERATED ALWAYS AS (json_extract(doc, {_literal(_json_path(field))})) VIRTUAL')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {_quote(f"{self.collection}_{field}")} '
+                         f'ON {self.table} ({_column(field)})')
+        if field not in self.indexes:
+            self.indexes.append(field)
+
+    def _where(self, filter_: Mapping[str, Any]) -> Tuple[str, list, bool]:
+        """
+        Turn the filter into a WHERE clause on `_id` and the indexed fields.
+        :return: The clause, its parameters, and whether it covers the whole filter.
+        """
+        conditions, params = [], []
+        covered = True
+        for f, v in filter_.items():
+            if f == '_id' and isinstance(v, (str, int)) and not isinstance(v, bool):
+                conditions.append('_id = ?')
+                params.append(v)
+            elif f in self.indexes and (c := _condition(f, v)) is not None:
+                conditions.append(c[0])
+                params += c[1]
+            else:
+                covered = False
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', params, covered
+
+    @staticmethod
+    def _match(v: Mapping[str, Any], filter_: Mapping[str, Any]) -> bool:
+        for f in filter_:
+            if f not in v:
+                return False
+            if v[f] != filter_[f]:
+                return False
+        return True
+
+    @staticmethod
+    def _mask(v: Mapping[str, Any], masking: Mapping[str, Any]) -> Item:
+        return Item(dict(filter(lambda x: masking.get(x[0], True), v.items())) if masking else v)
+
+    def _select(self, conn: sqlite3.Connection, filter_: Mapping[str, Any], limit: int = 0) -> List[dict]:
+        where, params, covered = self._where(filter_)
+        sql = f'SELECT doc FROM {self.table}{where}'
+        if covered and limit > 0:
+            sql += f' LIMIT {int(limit)}'
+        docs = (json.loads(row[0]) for row in conn.execute(sql, params))
+        return [v for v in docs if covered or self._match(v, filter_)]
+
+    def find(self, filter_: Mapping[str, Any] | None = None, masking: Mapping[str, Any] | None = None, limit: int = 0,
+             sort_key: str = "") -> Iterable[Item]:
+        if filter_ is None:
+            filter_ = {}
+        with self.pool.connection() as conn:
+            docs = self._select(conn, filter_, limit)
+        if limit > 0:
+            docs = docs[:limit]
+        for v in docs:
+            yield self._mask(v, masking)
+
+    def find_many(self, key: str, values: Iterable[Any], masking=None) -> Iterable[Item]:
+        values = list(dict.fromkeys(values))
+        if key == '_id':
+            column = '_id'
+        elif key in self.indexes:
+            column = _column(key)
+        else:
+            yield from super().find_many(key, values, masking)
+            return
+
+        docs = []
+        with self.pool.connection() as conn:
+            for i in range(0, len(values), MAX_VARIABLES):
+                chunk = values[i:i + MAX_VARIABLES]
+                sql = f'SELECT doc FROM {self.table} WHERE {column} IN ({",".join("?" * len(chunk))})'
+                docs += [json.loads(row[0]) for row in conn.execute(sql, chunk)]
+        for v in docs:
+            if key in v and v[key] in values:
+                yield self._mask(v, masking)
+
+    @staticmethod
+    def _prepare(item: Item | Mapping[str, Any]) -> Tuple[Any, str]:
+        v = item
+        while isinstance(v, Item):
+            v = v.data
+        if "_id" not in v:
+            v = {**v, "_id": uuid.uuid4().hex}
+        return v["_id"], _dumps(v)
+
+    def insert_one(self, item: Item | Mapping[str, Any]):
+        self.insert_many([item])
+
+    def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        rows = [self._prepare(i) for i in items]
+        if rows:
+            with self.pool.transaction() as conn:
+                conn.executemany(f'INSERT OR REPLACE INTO {self.table} (_id, doc) VALUES (?, ?)', rows)
+
+    def _update(self, filter_: Mapping[str, Any], update: Mapping[str, Any], limit: int):
+        with self.pool.transaction() as conn:
+            docs = self._select(conn, filter_, limit)[:limit or None]
+            rows = [(_dumps(apply_update(v, update)), v['_id']) for v in docs]
+            conn.executemany(f'UPDATE {self.table} SET doc = ? WHERE _id = ?', rows)
+
+    def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self._update(filter_, update, 1)
+
+    def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self._update(filter_, update, 0)
+
+    def _delete(self, filter_: Mapping[str, Any], limit: int):
+        with self.pool.transaction() as conn:
+            ids = [(v['_id'],) for v in self._select(conn, filter_, limit)[:limit or None]]
+            conn.executemany(f'DELETE FROM {self.table} WHERE _id = ?', ids)
+
+    def delete_one(self, filter_: Mapping[str, Any]):
+        self._delete(filter_, 1)
+
+    def delete_many(self, filter_: Mapping[str, Any]):
+        self._delete(filter_, 0)
+
+    def set_ttl(self, field: str, seconds: float):
+        super().set_ttl(field, seconds)
+        self._ensure_index(field)
+
+    def delete_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        field, seconds = self.ttl
+        # text sorts after numbers in sqlite, only numeric timestamps are compared
+        with self.pool.transaction() as conn:
+            return conn.execute(f'DELETE FROM {self.table} WHERE {_column(field)} < ?',
+                                (time.time() - seconds,)).rowcount
+
+    def save(self, item: Item) -> bool:
+        try:
+            self.insert_one(item)
+        except Exception:
+            return False
+        else:
+            return True
+
+
+class Sqlite(BaseDBA):
+    def __init__(self, config: ConfigParser):
+        super().__init__(config)
+        path_str = self.config.get_from_pointer("/path", None)
+        if path_str:
+            path = Path(path_str) / self.config.get_from_pointer("/file", "hcat.db")
+            path.parent.mkdir(parents=True, exist_ok=True)
+        else:
+            path = None
+        self.pool = _ConnectionPool(path,
+                                    synchronous=self.config.get_from_pointer("/synchronous", "NORMAL"),
+                                    busy_timeout=self.config.get_from_pointer("/busy-timeout", 5000),
+                                    cached_statements=self.config.get_from_pointer("/cached-statements", 128))
+        self.dbs: dict[str, SqliteCA] = {}
+
+    def close(self):
+        self.pool.close()
+
+    def get_collection(self, collection: str) -> BaseCA:
+        if collection not in self.dbs:
+            self.dbs[collection] = SqliteCA(global_config=self.global_config, config=self.config,
+                                            collection=collection, pool=self.pool)
+        return self.dbs[collection]
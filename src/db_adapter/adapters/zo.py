@@ -22,6 +22,10 @@
 
 @Version    : 1.0.0
 """
+import logging
+import pickle
+import threading
+import time
 import uuid
 from pathlib import Path
 
@@ -53,17 +57,47 @@ from src.util.config_parser import ConfigParser
 
 @Version    : 1.0.0
 """
-from typing import Mapping, Any, Iterable
+from typing import Mapping, Any, Iterable, Hashable
 
+from BTrees.OOBTree import OOBTree, OOTreeSet
+from persistent.mapping import PersistentMapping
 from src.db_adapter.base_dba import BaseCA, BaseDBA, Item
+from src.db_adapter.update_operators import apply_update
 from ZODB import DB
 
 import transaction
 
+# the layout of the root: the documents by _id, and the secondary indexes by field
+DOCUMENTS_KEY = 'documents'
+INDEXES_KEY = 'indexes'
+# the expiry index: the documents by time bucket, and the (field, bucket width) it was built for
+EXPIRY_KEY = 'expiry'
+EXPIRY_META_KEY = 'expiry-meta'
+
+
+def _index_key(value: Any) -> tuple | None:
+    """
+    Get the key of a value in an index, None if the value can not be indexed.
+    Numbers share one tag so that 1 and 1.0 meet in the index, like they do with `==`.
+    """
+    if isinstance(value, str):
+        return 's', value
+    if isinstance(value, (int, float)):
+        return 'n', value
+    return None
+
+
+def _copy(value: Any) -> Any:
+    """
+    Copy a value going into or out of the database, so callers never share containers with the stored records.
+    """
+    return pickle.loads(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
 
 class ZoCA(BaseCA):
     def __init__(self, global_config: ConfigParser, config: ConfigParser, collection: str):
         super().__init__(global_config, config, collection)
+        self.logger = logging.getLogger(__name__)
         path_str = self.config.get("path", None)
         if path_str:
             path = Path(path_str) / f'{collection}.fs'
@@ -73,10 +107,252 @@ class ZoCA(BaseCA):
         else:
             self.storage = None
 
+        # the connection is shared by all threads (under `lock`), so it gets its own transaction manager instead of
+        # the thread-local one
+        self.tm = transaction.TransactionManager()
         self.db = DB(self.storage)
-        self.connection = self.db.open()
+        self.connection = self.db.open(self.tm)
         self.conn = self.connection.root()
 
+        # a ZODB connection must not be used by several threads at the same time
+        self.lock = threading.RLock()
+
+        self._init_layout()
+        self.indexes: Mapping[str, OOBTree] = {}
+        self._init_indexes(self.config.get_from_pointer("/indexes", ["user_id", "rid", "id", "time"]))
+        self.expiry: OOBTree | None = None
+        self.expiry_bucket = self.config.get_from_pointer("/expiry-bucket", 60)
+
+        # group commit
+        self.commit_mode = self.config.get_from_pointer("/commit/mode", "immediate")
+        self.commit_interval = self.config.get_from_pointer("/commit/interval", 0.01)
+        self.commit_max_batch = self.config.get_from_pointer("/commit/max-batch", 256)
+        self.commit_durability = self.config.get_from_pointer("/commit/durability", "sync")
+        self._cond = threading.Condition(self.lock)
+        self._pending = 0
+        self._first_pending_at = 0.0
+        self._committed = 0
+        self._failed_batch = -1
+        self._closed = False
+        self._committer = None
+        if self.commit_mode == "group":
+            self._committer = threading.Thread(target=self._group_committer, daemon=True,
+                                               name=f"ZoGroupCommitter-{collection}")
+            self._committer.start()
+
+    def _init_layout(self):
+        """
+        Move the documents of the old layout (plain dicts in the root) into a BTree of persistent records, so a write
+        only stores the changed record instead of the whole root.
+        """
+        with self.lock:
+            if DOCUMENTS_KEY in self.conn:
+                self.documents: OOBTree = self.conn[DOCUMENTS_KEY]
+                return
+
+            self.documents = OOBTree()
+            old = list(self.conn.items())
+            self.conn.clear()
+            for _id, v in old:
+                if isinstance(v, dict):
+                    self.documents[_id] = PersistentMapping(v)
+            self.conn[DOCUMENTS_KEY] = self.documents
+            self.tm.commit()
+
+    def _init_indexes(self, fields: Iterable[str]):
+        """
+        Load the indexes of the fields, build the missing ones and drop the ones no longer configured.
+        """
+        with self.lock:
+            if INDEXES_KEY not in self.conn:
+                self.conn[INDEXES_KEY] = OOBTree()
+            indexes = self.conn[INDEXES_KEY]
+
+            changed = False
+            for field in list(indexes.keys()):
+                if field not in fields:
+                    del indexes[field]
+                    changed = True
+            for field in fields:
+                if field not in indexes:
+                    indexes[field] = OOBTree()
+                    for _id, v in self.documents.items():
+                        self._index_add(indexes[field], _id, v.get(field, None), field in v)
+                    changed = True
+            if changed:
+                self.tm.commit()
+            self.indexes = {field: indexes[field] for field in fields}
+
+    def _commit(self):
+        """
+        Commit the changes, called with the lock held.
+        In the group mode the changes of many writes are committed together by the committer thread, the writer waits
+        for it if the durability is "sync".
+        """
+        if self._committer is None:
+            self.tm.commit()
+            return
+
+        if self._pending == 0:
+            self._first_pending_at = time.monotonic()
+        self._pending += 1
+        self._cond.notify_all()
+        if self.commit_durability == "sync":
+            batch = self._committed
+            while self._committed == batch:
+                self._cond.wait()
+            if self._failed_batch == batch:
+                raise RuntimeError(f'Failed to commit the changes of {self.collection}.')
+
+    def _flush_batch(self):
+        """
+        Commit the pending writes as one transaction, called with the lock held.
+        """
+        if not self._pending:
+            return
+        try:
+            self.tm.commit()
+        except Exception as err:
+            self.logger.exception(err)
+            self.tm.abort()
+            self._failed_batch = self._committed
+        self._pending = 0
+        self._committed += 1
+        self._cond.notify_all()
+
+    def _group_committer(self):
+        with self._cond:
+            while not self._closed:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                # wait for more writes until the batch is full or the oldest write has waited long enough
+                while not self._closed and self._pending < self.commit_max_batch and \
+                        (remaining := self._first_pending_at + self.commit_interval - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+                self._flush_batch()
+
+    def close(self):
+        """
+        Commit the pending writes and close the database.
+        """
+        with self._cond:
+            self._closed = True
+            self._flush_batch()
+            self._cond.notify_all()
+        if self._committer is not None:
+            self._committer.join()
+        self.tm.commit()
+        self.connection.close()
+        self.db.close()
+        if self.storage is not None:
+            self.storage.close()
+
+    @staticmethod
+    def _tree_add(tree: OOBTree, key: Any, _id: Hashable):
+        if key not in tree:
+            tree[key] = OOTreeSet()
+        tree[key].add(_id)
+
+    @staticmethod
+    def _tree_remove(tree: OOBTree, key: Any, _id: Hashable):
+        if ids := tree.get(key):
+            if _id in ids:
+                ids.remove(_id)
+            if not ids:
+                del tree[key]
+
+    def _index_add(self, index: OOBTree, _id: Hashable, value: Any, present: bool = True):
+        if present and (key := _index_key(value)) is not None:
+            self._tree_add(index, key, _id)
+
+    def _index_remove(self, index: OOBTree, _id: Hashable, value: Any, present: bool = True):
+        if present and (key := _index_key(value)) is not None:
+            self._tree_remove(index, key, _id)
+
+    def _expiry_bucket(self, v: Mapping[str, Any] | None) -> int | None:
+        if v is None or not isinstance(t := v.get(self.ttl[0]), (int, float)):
+            return None
+        return int(t // self.expiry_bucket)
+
+    def set_ttl(self, field: str, seconds: float):
+        super().set_ttl(field, seconds)
+        with self.lock:
+            if EXPIRY_KEY not in self.conn or self.conn.get(EXPIRY_META_KEY) != (field, self.expiry_bucket):
+                expiry = OOBTree()
+                for _id, v in self.documents.items():
+                    if (bucket := self._expiry_bucket(v)) is not None:
+                        self._tree_add(expiry, bucket, _id)
+                self.conn[EXPIRY_KEY] = expiry
+                self.conn[EXPIRY_META_KEY] = (field, self.expiry_bucket)
+                self.tm.commit()
+            self.expiry = self.conn[EXPIRY_KEY]
+
+    def delete_expired(self) -> int:
+        if self.expiry is None:
+            return super().delete_expired()
+        field, seconds = self.ttl
+        cutoff = time.time() - seconds
+        count = 0
+        with self.lock:
+            for bucket in list(self.expiry.keys(max=int(cutoff // self.expiry_bucket))):
+                # every document of a bucket that ended before the cutoff has expired
+                whole = (bucket + 1) * self.expiry_bucket <= cutoff
+                for _id in list(self.expiry[bucket]):
+                    v = self.documents[_id]
+                    if whole or v[field] < cutoff:
+                        self._reindex(_id, v, None)
+                        del self.documents[_id]
+                        count += 1
+            if count:
+                self._commit()
+        return count
+
+    def _reindex(self, _id: Hashable, old: Mapping[str, Any] | None, new: Mapping[str, Any] | None):
+        for field, index in self.indexes.items():
+            old_present = old is not None and field in old
+            new_present = new is not None and field in new
+            old_v = old.get(field) if old_present else None
+            new_v = new.get(field) if new_present else None
+            if old_present == new_present and old_v == new_v and type(old_v) is type(new_v):
+                continue
+            if old_present:
+                self._index_remove(index, _id, old_v)
+            if new_present:
+                self._index_add(index, _id, new_v)
+
+        if self.expiry is not None and (old_b := self._expiry_bucket(old)) != (new_b := self._expiry_bucket(new)):
+            if old_b is not None:
+                self._tree_remove(self.expiry, old_b, _id)
+            if new_b is not None:
+                self._tree_add(self.expiry, new_b, _id)
+
+    def _candidates(self, filter_: Mapping[str, Any]) -> Iterable[tuple[Hashable, Mapping[str, Any]]]:
+        """
+        Get the documents that may match the filter, through an index if the filter covers an indexed field.
+        """
+        with self.lock:
+            if '_id' in filter_:
+                _id = filter_['_id']
+                return [(_id, v)] if (v := self.documents.get(_id)) is not None else []
+            for field, index in self.indexes.items():
+                if field in filter_ and (key := _index_key(filter_[field])) is not None:
+                    return [(_id, self.documents[_id]) for _id in index.get(key, ())]
+            return list(self.documents.items())
+
+    @staticmethod
+    def _match(v: Mapping[str, Any], filter_: Mapping[str, Any]) -> bool:
+        for f in filter_:
+            if f not in v:
+                return False
+            if v[f] != filter_[f]:
+                return False
+        return True
+
+    @staticmethod
+    def _mask(v: Mapping[str, Any], masking: Mapping[str, Any]) -> Item:
+        return Item(_copy(dict(filter(lambda x: masking.get(x[0], True), v.items()))))
+
     def find(self, filter_: Mapping[str, Any] | None = None, masking: Mapping[str, Any] | None = None, limit: int = 0,
              sort_key: str = "") -> \
             Iterable[Item]:
@@ -84,45 +360,105 @@ class ZoCA(BaseCA):
             filter_ = {}
         if masking is None:
             masking = {}
-        for i, v in self.conn.items():
+        # the records are changed by the writers under the lock, they are matched and copied under it too
+        rt = []
+        with self.lock:
+            for i, v in self._candidates(filter_):
+                if self._match(v, filter_):
+                    rt.append(self._mask(v, masking))
+                    if len(rt) == limit:
+                        break
+        yield from rt
 
-            for f in filter_:
-                if f not in v:
-                    break
-                if v[f] != filter_[f]:
-                    break
+    def find_many(self, key: str, values: Iterable[Any], masking=None) -> Iterable[Item]:
+        if masking is None:
+            masking = {}
+        values = list(values)
+        keys = [_index_key(i) for i in values]
+        with self.lock:
+            if key == '_id':
+                candidates = [(i, self.documents[i]) for i in dict.fromkeys(values) if i in self.documents]
+            elif key in self.indexes and None not in keys:
+                ids = set()
+                for k in keys:
+                    ids.update(self.indexes[key].get(k, ()))
+                candidates = [(i, self.documents[i]) for i in ids]
             else:
-                yield Item(dict(filter(lambda x: masking.get(x[0], True), v.items())))
+                candidates = list(self.documents.items())
+            rt = [self._mask(v, masking) for i, v in candidates if key in v and v[key] in values]
+        yield from rt
 
-    def insert_one(self, item: Item | Mapping[str, Any]):
+    def _insert(self, item: Item | Mapping[str, Any]):
         v = item
-        while isinstance(item, Item):
-            v = item.data
+        while isinstance(v, Item):
+            v = v.data
         if "_id" in v:
             _id = v["_id"]
         else:
             _id = uuid.uuid4().hex
             v = {**v, "_id": _id}
-        self.conn[_id] = v
-        transaction.commit()
+        self._reindex(_id, self.documents.get(_id), v)
+        self.documents[_id] = PersistentMapping(_copy(v))
+
+    def insert_one(self, item: Item | Mapping[str, Any]):
+        with self.lock:
+            self._insert(item)
+            self._commit()
+
+    def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        with self.lock:
+            count = 0
+            for item in items:
+                self._insert(item)
+                count += 1
+            if count:
+                self._commit()
 
     def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
-        v = self.find_one(filter_)
-        if v:
-            _id = v["_id"]
-            rt = v.data
-            rt.update(update.get("$set", {}))
-            self.conn[_id] = rt
-            transaction.commit()
-        else:
-            self.insert_one(update)
+        with self.lock:
+            v = self.find_one(filter_)
+            if v:
+                self._update(v["_id"], update)
+                self._commit()
+            else:
+                self.insert_one(update)
+
+    def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        with self.lock:
+            ids = [_id for _id, v in self._candidates(filter_) if self._match(v, filter_)]
+            for _id in ids:
+                self._update(_id, update)
+            if ids:
+                self._commit()
+
+    def _update(self, _id: Hashable, update: Mapping[str, Any]):
+        record = self.documents[_id]
+        new = apply_update(record, update)
+        self._reindex(_id, record, new)
+        for k in list(record):
+            if k not in new:
+                del record[k]
+        for k, v in new.items():
+            if k not in record or record[k] is not v:
+                record[k] = v
 
     def delete_one(self, filter_: Mapping[str, Any]):
-        v = self.find_one(filter_)
-        if v:
-            _id = v["_id"]
-            del self.conn[_id]
-            transaction.commit()
+        with self.lock:
+            v = self.find_one(filter_)
+            if v:
+                _id = v["_id"]
+                self._reindex(_id, self.documents[_id], None)
+                del self.documents[_id]
+                self._commit()
+
+    def delete_many(self, filter_: Mapping[str, Any]):
+        with self.lock:
+            ids = [_id for _id, v in self._candidates(filter_) if self._match(v, filter_)]
+            for _id in ids:
+                self._reindex(_id, self.documents[_id], None)
+                del self.documents[_id]
+            if ids:
+                self._commit()
 
     def save(self, item: Item) -> bool:
         try:
@@ -137,20 +473,16 @@ class Zo(BaseDBA):
     def __init__(self, config: ConfigParser):
         super().__init__(config)
         self.dbs: dict[str, ZoCA] = {}
+        # a storage can only be opened once, so two threads must not open the same collection
+        self._lock = threading.Lock()
 
     def close(self):
         for i in self.dbs:
-
-            if not transaction.get().isDoomed():
-                transaction.commit()
-            self.dbs[i].connection.close()
-            self.dbs[i].db.close()
-            self.dbs[i].storage.close()
+            self.dbs[i].close()
 
     def get_collection(self, collection: str) -> BaseCA:
-        if collection not in self.dbs:
-            db = ZoCA(global_config=self.global_config, config=self.config, collection=collection)
-            self.dbs[collection] = db
-        else:
-            db = self.dbs[collection]
-        return db
+        with self._lock:
+            if collection not in self.dbs:
+                self.dbs[collection] = ZoCA(global_config=self.global_config, config=self.config,
+                                            collection=collection)
+            return self.dbs[collection]
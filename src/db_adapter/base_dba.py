@@ -23,12 +23,14 @@
 @Version    : 1.0.0
 """
 import abc
-import copy
+import asyncio
+import time
 import typing
 from collections import UserDict
-from contextlib import contextmanager
-from typing import Mapping, Any, Iterable
+from contextlib import asynccontextmanager, contextmanager
+from typing import Mapping, Any, Iterable, List, Tuple
 
+from src.db_adapter.change_tracker import ChangeTracker
 from src.util.config_parser import ConfigParser
 
 
@@ -49,6 +51,8 @@ class BaseCA(metaclass=abc.ABCMeta):
         self.global_config = global_config
         self.config = config
         self.collection = collection
+        # (field, seconds), see `set_ttl`
+        self.ttl: Tuple[str, float] | None = None
 
     @abc.abstractmethod
     def find(self,
@@ -84,6 +88,26 @@ class BaseCA(metaclass=abc.ABCMeta):
         else:
             return None
 
+    def find_one_for_update(self, filter_: Mapping[str, Any]) -> (Item | None):
+        """
+        Get a value from database that is going to be changed and written back, such as in `enter_one`.
+        A wrapper serving values from a cache must read it from the database.
+        :param filter_:
+        :return:
+        """
+        return self.find_one(filter_=filter_)
+
+    def find_many(self, key: str, values: Iterable[Any], masking=None) -> Iterable[Item]:
+        """
+        Get the values whose `key` is one of `values` (such as a list of ids), in no particular order.
+        :param key: The field to match, such as 'rid'.
+        :param values:
+        :param masking:
+        :return:
+        """
+        for v in dict.fromkeys(values):
+            yield from self.find(filter_={key: v}, masking=masking)
+
     @abc.abstractmethod
     def insert_one(self, item: Item | Mapping[str, Any]):
         """
@@ -93,6 +117,15 @@ class BaseCA(metaclass=abc.ABCMeta):
         """
         pass
 
+    def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        """
+        Insert values to database.
+        :param items:
+        :return:
+        """
+        for item in items:
+            self.insert_one(item)
+
     @abc.abstractmethod
     def update_one(self, filter_: Mapping[str, Any],
                    update: Mapping[str, Any]):
@@ -107,8 +140,14 @@ class BaseCA(metaclass=abc.ABCMeta):
     def update_many(self,
                     filter_: Mapping[str, Any],
                     update: Mapping[str, Any]):
-        while self.find_one(filter_=filter_):
-            self.update_one(filter_=filter_, update=update)
+        """
+        Update all values that match the filter.
+        :param filter_:
+        :param update:
+        :return:
+        """
+        for i in list(self.find(filter_=filter_)):
+            self.update_one(filter_={'_id': i['_id']}, update=update)
 
     @abc.abstractmethod
     def delete_one(self, filter_: Mapping[str, Any]):
@@ -120,8 +159,39 @@ class BaseCA(metaclass=abc.ABCMeta):
         pass
 
     def delete_many(self, filter_: Mapping[str, Any]):
-        while self.find_one(filter_=filter_):
-            self.delete_one(filter_=filter_)
+        """
+        Delete all values that match the filter.
+        :param filter_:
+        :return:
+        """
+        for i in list(self.find(filter_=filter_)):
+            self.delete_one(filter_={'_id': i['_id']})
+
+    def set_ttl(self, field: str, seconds: float):
+        """
+        Let values expire `seconds` after the timestamp in their `field`.
+        Expired values are removed by `delete_expired`, adapters may also remove them by themselves.
+        :param field: The field of the timestamp, such as 'time'.
+        :param seconds:
+        :return:
+        """
+        self.ttl = (field, seconds)
+
+    def delete_expired(self) -> int:
+        """
+        Delete the expired values.
+        This default scans the whole collection, adapters should only touch the expired values.
+        :return: The number of deleted values.
+        """
+        if self.ttl is None:
+            return 0
+        field, seconds = self.ttl
+        cutoff = time.time() - seconds
+        expired = [i['_id'] for i in self.find(filter_={})
+                   if isinstance(i.get(field), (int, float)) and i[field] < cutoff]
+        for _id in expired:
+            self.delete_one(filter_={'_id': _id})
+        return len(expired)
 
     @abc.abstractmethod
     def save(self, item: Item) -> bool:
@@ -136,21 +206,20 @@ class BaseCA(metaclass=abc.ABCMeta):
     def enter_one(self, filter_: Mapping[str, Any]) -> typing.Generator[Item, None, None]:
         """
         Enter a value from database.
+        Only the changes are written back, as update operators on the `_id` of the value.
         """
 
-        i = self.find_one(filter_=filter_)
+        i = self.find_one_for_update(filter_=filter_)
 
         if i:
-            old_v = copy.deepcopy(i.data)
+            tracker = ChangeTracker(i.data)
+            target = {'_id': tracker.id} if tracker.id is not None else filter_
 
             yield i
             if i.data is None:
-                self.delete_one(filter_=old_v)
-            else:
-
-                set_list = filter(lambda x: x[1] != old_v.get(x[0]), i.data.items())
-                if upd := dict(set_list):
-                    self.update_one(filter_=old_v, update={'$set': upd})
+                self.delete_one(filter_=target)
+            elif update := tracker.diff(i.data):
+                self.update_one(filter_=target, update=update)
         else:
             i = Item({})
             yield i
@@ -158,6 +227,158 @@ class BaseCA(metaclass=abc.ABCMeta):
                 self.insert_one(item=i)
 
 
+class AsyncBaseCA(metaclass=abc.ABCMeta):
+    """
+    The async variant of `BaseCA`, for the events running on an event loop: the same methods, as coroutines.
+    `find` returns a list instead of an iterator.
+    """
+
+    def __init__(self, collection: str):
+        self.collection = collection
+
+    @abc.abstractmethod
+    async def find(self,
+                   filter_: Mapping[str, Any] | None = None,
+                   masking: Mapping[str, Any] | None = None,
+                   limit: int = 0,
+                   sort_key: str = "") -> List[Item]:
+        """
+        Get values from database.
+        :param filter_:
+        :param masking:
+        :param limit:
+        :param sort_key:
+        :return:
+        """
+        pass
+
+    async def find_one(self, filter_: Mapping[str, Any], masking=None) -> (Item | None):
+        """
+        Get a value from database.
+        :param filter_:
+        :param masking:
+        :return:
+        """
+        if v_p := await self.find(filter_=filter_, masking=masking, limit=1):
+            return v_p[0]
+        return None
+
+    async def find_many(self, key: str, values: Iterable[Any], masking=None) -> List[Item]:
+        """
+        Get the values whose `key` is one of `values`, in no particular order.
+        :param key:
+        :param values:
+        :param masking:
+        :return:
+        """
+        rt = []
+        for v in dict.fromkeys(values):
+            rt += await self.find(filter_={key: v}, masking=masking)
+        return rt
+
+    @abc.abstractmethod
+    async def insert_one(self, item: Item | Mapping[str, Any]):
+        """
+        Insert a value to database.
+        :param item:
+        :return:
+        """
+        pass
+
+    async def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        for item in items:
+            await self.insert_one(item)
+
+    @abc.abstractmethod
+    async def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        """
+        Update a value with the update operators.
+        :param filter_:
+        :param update:
+        :return:
+        """
+        pass
+
+    async def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        for i in await self.find(filter_=filter_):
+            await self.update_one(filter_={'_id': i['_id']}, update=update)
+
+    @abc.abstractmethod
+    async def delete_one(self, filter_: Mapping[str, Any]):
+        """
+        Delete a value from database.
+        :param filter_:
+        :return:
+        """
+        pass
+
+    async def delete_many(self, filter_: Mapping[str, Any]):
+        for i in await self.find(filter_=filter_):
+            await self.delete_one(filter_={'_id': i['_id']})
+
+    @asynccontextmanager
+    async def enter_one(self, filter_: Mapping[str, Any]) -> typing.AsyncGenerator[Item, None]:
+        """
+        Enter a value from database, as `BaseCA.enter_one`.
+        """
+        i = await self.find_one(filter_=filter_)
+
+        if i:
+            tracker = ChangeTracker(i.data)
+            target = {'_id': tracker.id} if tracker.id is not None else filter_
+
+            yield i
+            if i.data is None:
+                await self.delete_one(filter_=target)
+            elif update := tracker.diff(i.data):
+                await self.update_one(filter_=target, update=update)
+        else:
+            i = Item({})
+            yield i
+            if not bool(i):
+                await self.insert_one(item=i)
+
+
+class ThreadedCA(AsyncBaseCA):
+    """
+    The async API of an adapter without an async driver: the calls of its `BaseCA` run in the threads of the loop's
+    default executor.
+    """
+
+    def __init__(self, ca: BaseCA):
+        super().__init__(ca.collection)
+        self.ca = ca
+
+    async def find(self, filter_: Mapping[str, Any] | None = None, masking: Mapping[str, Any] | None = None,
+                   limit: int = 0, sort_key: str = "") -> List[Item]:
+        return await asyncio.to_thread(lambda: list(self.ca.find(filter_=filter_, masking=masking, limit=limit,
+                                                                 sort_key=sort_key)))
+
+    async def find_one(self, filter_: Mapping[str, Any], masking=None) -> (Item | None):
+        return await asyncio.to_thread(self.ca.find_one, filter_=filter_, masking=masking)
+
+    async def find_many(self, key: str, values: Iterable[Any], masking=None) -> List[Item]:
+        return await asyncio.to_thread(lambda: list(self.ca.find_many(key, values, masking=masking)))
+
+    async def insert_one(self, item: Item | Mapping[str, Any]):
+        await asyncio.to_thread(self.ca.insert_one, item)
+
+    async def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        await asyncio.to_thread(self.ca.insert_many, list(items))
+
+    async def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        await asyncio.to_thread(self.ca.update_one, filter_=filter_, update=update)
+
+    async def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        await asyncio.to_thread(self.ca.update_many, filter_=filter_, update=update)
+
+    async def delete_one(self, filter_: Mapping[str, Any]):
+        await asyncio.to_thread(self.ca.delete_one, filter_=filter_)
+
+    async def delete_many(self, filter_: Mapping[str, Any]):
+        await asyncio.to_thread(self.ca.delete_many, filter_=filter_)
+
+
 class BaseDBA(metaclass=abc.ABCMeta):
     def __init__(self, config: ConfigParser):
         self.global_config = config
@@ -180,5 +401,14 @@ class BaseDBA(metaclass=abc.ABCMeta):
         """
         pass
 
+    def get_async_collection(self, collection: str) -> AsyncBaseCA:
+        """
+        Get a collection with the async API.
+        Adapters with an async driver override this, the others run their blocking calls in threads.
+        :param collection:
+        :return:
+        """
+        return ThreadedCA(self.get_collection(collection))
+
     def __getitem__(self, item) -> BaseCA:
         return self.get_collection(item)
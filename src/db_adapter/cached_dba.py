@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : cached_dba.py
+
+@Author     : hsn
+
+@Date       : 10/18/26 11:20 PM
+
+@Version    : 1.0.0
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Mapping, Set, Tuple
+
+from src.db_adapter.base_dba import AsyncBaseCA, BaseCA, BaseDBA, Item, ThreadedCA
+from src.util.config_parser import ConfigParser
+
+
+class CachedCA(BaseCA):
+    """
+    A read cache in front of a collection.
+
+    `find_one` results are kept in a bounded LRU for `ttl` seconds and handed out as copies. Every write goes to the
+    wrapped collection first and then drops the cached values it may have changed. Writes that do not go through the
+    cache (another process) are only seen after `ttl`, so it is meant for a single server process.
+
+    Every write also stamps the `_id` it changed (or the whole collection if it has no `_id` in its filter) with a
+    generation, and a value read from the database is only cached if nothing it may be was written since the read
+    started. Otherwise a write landing between the read and the fill would leave the old value cached.
+    """
+
+    def __init__(self, ca: BaseCA, size: int = 4096, ttl: float = 60):
+        super().__init__(ca.global_config, ca.config, ca.collection)
+        self.ca = ca
+        self.size = size
+        self.cache_ttl = ttl
+        # key => (pickled document, _id, expiry time)
+        self._cache: OrderedDict[Hashable, Tuple[bytes, Any, float]] = OrderedDict()
+        self._by_id: Dict[Any, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        # the generation of the last write, of every `_id` written and of the last write without `_id`
+        self._generation = 0
+        self._written: Dict[Any, int] = {}
+        self._written_all = 0
+        # the generations the running reads started at, the older stamps are not needed by them
+        self._reads: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getattr__(self, item):
+        # adapter specific attributes, such as `ensure_indexes`
+        if item == 'ca':
+            raise AttributeError(item)
+        return getattr(self.ca, item)
+
+    @staticmethod
+    def _key(filter_: Mapping[str, Any], masking: Mapping[str, Any] | None) -> Hashable | None:
+        if not isinstance(filter_, Mapping) or not (masking is None or isinstance(masking, Mapping)):
+            return None
+        try:
+            key = (tuple(sorted(filter_.items())), tuple(sorted(masking.items())) if masking else ())
+            hash(key)
+        except TypeError:
+            # operators such as {'$in': [...]} are not cached
+            return None
+        return key
+
+    def _drop(self, key: Hashable):
+        # called with the lock held
+        _, _id, _ = self._cache.pop(key)
+        if keys := self._by_id.get(_id):
+            keys.discard(key)
+            if not keys:
+                del self._by_id[_id]
+
+    def _invalidate(self, filter_: Mapping[str, Any] | None):
+        """
+        Drop the cached values that may be changed by a write with the filter.
+        """
+        with self._lock:
+            self._generation += 1
+            if isinstance(filter_, Mapping) and '_id' in filter_ and isinstance(filter_['_id'], Hashable):
+                self._written[filter_['_id']] = self._generation
+                if len(self._written) > 2 * self.size:
+                    self._prune_written()
+                keys = list(self._by_id.get(filter_['_id'], ()))
+            else:
+                self._written_all = self._generation
+                keys = [k for k, (blob, _, _) in self._cache.items() if self._match(pickle.loads(blob), filter_)]
+            for k in keys:
+                self._drop(k)
+
+    def _prune_written(self):
+        # called with the lock held
+        oldest = min(self._reads, default=self._generation)
+        self._written = {k: v for k, v in self._written.items() if v > oldest}
+
+    def _end_read(self, start: int):
+        # called with the lock held
+        if self._reads[start] == 1:
+            del self._reads[start]
+        else:
+            self._reads[start] -= 1
+
+    @staticmethod
+    def _match(v: Mapping[str, Any], filter_: Mapping[str, Any] | None) -> bool:
+        if not isinstance(filter_, Mapping):
+            return True
+        return all(f in v and v[f] == filter_[f] for f in filter_ or {})
+
+    def find_one(self, filter_: Mapping[str, Any], masking=None) -> (Item | None):
+        if (key := self._key(filter_, masking)) is None:
+            return self.ca.find_one(filter_=filter_, masking=masking)
+
+        with self._lock:
+            if (entry := self._cache.get(key)) is not None:
+                if entry[2] > time.monotonic():
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return Item(pickle.loads(entry[0]))
+                self._drop(key)
+            self.misses += 1
+            start = self._generation
+            self._reads[start] = self._reads.get(start, 0) + 1
+
+        try:
+            i = self.ca.find_one(filter_=filter_, masking=masking)
+        except BaseException:
+            with self._lock:
+                self._end_read(start)
+            raise
+
+        # misses are not cached, an insert would have to find them
+        blob = pickle.dumps(i.data, protocol=pickle.HIGHEST_PROTOCOL) \
+            if i and '_id' in i.data and isinstance(i.data['_id'], Hashable) else None
+        with self._lock:
+            self._end_read(start)
+            # not if it was written while it was being read, the value read may be the old one
+            if blob is not None and self._written_all <= start and self._written.get(i.data['_id'], 0) <= start:
+                if key in self._cache:
+                    self._drop(key)
+                self._cache[key] = (blob, i.data['_id'], time.monotonic() + self.cache_ttl)
+                self._by_id.setdefault(i.data['_id'], set()).add(key)
+                while len(self._cache) > self.size:
+                    self._drop(next(iter(self._cache)))
+                    self.evictions += 1
+        return i
+
+    def find_one_for_update(self, filter_: Mapping[str, Any]) -> (Item | None):
+        # the value is going to be written back, it must not be a stale copy
+        return self.ca.find_one_for_update(filter_=filter_)
+
+    def find(self, filter_: Mapping[str, Any] | None = None, masking: Mapping[str, Any] | None = None, limit: int = 0,
+             sort_key: str = "") -> Iterable[Item]:
+        return self.ca.find(filter_=filter_, masking=masking, limit=limit, sort_key=sort_key)
+
+    def find_many(self, key: str, values: Iterable[Any], masking=None) -> Iterable[Item]:
+        return self.ca.find_many(key, values, masking=masking)
+
+    def insert_one(self, item: Item | Mapping[str, Any]):
+        self.ca.insert_one(item)
+        if '_id' in (v := item.data if isinstance(item, Item) else item):
+            self._invalidate({'_id': v['_id']})
+
+    def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        items = list(items)
+        self.ca.insert_many(items)
+        for item in items:
+            if '_id' in (v := item.data if isinstance(item, Item) else item):
+                self._invalidate({'_id': v['_id']})
+
+    def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self.ca.update_one(filter_=filter_, update=update)
+        self._invalidate(filter_)
+
+    def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self.ca.update_many(filter_=filter_, update=update)
+        self._invalidate(filter_)
+
+    def delete_one(self, filter_: Mapping[str, Any]):
+        self.ca.delete_one(filter_=filter_)
+        self._invalidate(filter_)
+
+    def delete_many(self, filter_: Mapping[str, Any]):
+        self.ca.delete_many(filter_=filter_)
+        self._invalidate(filter_)
+
+    def save(self, item: Item) -> bool:
+        rt = self.ca.save(item)
+        if '_id' in item.data:
+            self._invalidate({'_id': item.data['_id']})
+        return rt
+
+    def set_ttl(self, field: str, seconds: float):
+        super().set_ttl(field, seconds)
+        self.ca.set_ttl(field, seconds)
+
+    def delete_expired(self) -> int:
+        count = self.ca.delete_expired()
+        if count:
+            with self._lock:
+                self._generation += 1
+                self._written_all = self._generation
+                for k in list(self._cache):
+                    self._drop(k)
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the counters of the cache.
+        :return:
+        """
+        return {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class CachedDBA(BaseDBA):
+    """
+    Wrap a database adapter, caching the collections listed in `/db/cache/collections`.
+    The other collections (such as events, which are mostly written once and read once) are passed through.
+    """
+
+    def __init__(self, config: ConfigParser, dba: BaseDBA):
+        # not an adapter of `/db/adapters`, the config is at `/db/cache`
+        self.global_config = config
+        self.config = ConfigParser(config.get_from_pointer('/db/cache', {}))
+        self.dba = dba
+        self.collections: Dict[str, BaseCA] = {}
+        self.async_collections: Dict[str, AsyncBaseCA] = {}
+
+    def get_collection(self, collection: str) -> BaseCA:
+        if collection not in self.collections:
+            ca = self.dba.get_collection(collection)
+            if (conf := self.config.get_from_pointer(f'/collections/{collection}')) is not None:
+                ca = CachedCA(ca, size=conf.get('size', 4096), ttl=conf.get('ttl', 60))
+            self.collections[collection] = ca
+        return self.collections[collection]
+
+    def get_async_collection(self, collection: str) -> AsyncBaseCA:
+        if collection not in self.async_collections:
+            if isinstance(ca := self.get_collection(collection), CachedCA):
+                # through the cache in threads, the async driver of the adapter would not see nor drop the cached values
+                self.async_collections[collection] = ThreadedCA(ca)
+            else:
+                self.async_collections[collection] = self.dba.get_async_collection(collection)
+        return self.async_collections[collection]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the counters of the cached collections.
+        :return:
+        """
+        return {k: v.stats() for k, v in self.collections.items() if isinstance(v, CachedCA)}
+
+    def close(self):
+        self.dba.close()
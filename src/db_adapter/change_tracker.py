@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : change_tracker.py
+
+@Author     : hsn
+
+@Date       : 10/18/26 9:05 PM
+
+@Version    : 1.0.0
+"""
+import pickle
+from typing import Any, Dict, Mapping
+
+
+def _dumps(value: Any) -> bytes | None:
+    try:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+
+
+def _is_path_key(key: Any) -> bool:
+    # keys that can be a part of a dotted path
+    return isinstance(key, str) and key != '' and '.' not in key and not key.startswith('$')
+
+
+class ChangeTracker:
+    """
+    Find out what has changed in a document, as update operators.
+
+    Every field is remembered as a pickle instead of a deep copy. When the document is written back, fields whose
+    pickle is unchanged are skipped, the others are compared with their old value path by path:
+    changed keys of dicts become `$set`/`$unset` on nested paths, lists that were only appended to become `$push`,
+    lists that only lost some values become `$pull`, anything else is `$set` as a whole.
+    """
+
+    def __init__(self, doc: Mapping[str, Any]):
+        """
+        :param doc: The document as it was read from the database.
+        """
+        self.id = doc.get('_id')
+        self._pickles = {k: _dumps(v) for k, v in doc.items() if k != '_id'}
+
+    def diff(self, doc: Mapping[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the update operators that turn the old document into `doc`.
+        Fields missing from `doc` are left alone.
+        :param doc: The new document.
+        :return: The update operators, empty if nothing has changed.
+        """
+        update = {}
+        for k, v in doc.items():
+            if k == '_id':
+                continue
+            if (old := self._pickles.get(k, None)) is None:
+                update.setdefault('$set', {})[k] = v
+            elif old != _dumps(v):
+                self._diff(pickle.loads(old), v, k, update)
+        return update
+
+    @classmethod
+    def _diff(cls, old: Any, new: Any, path: str, update: Dict[str, Dict[str, Any]]):
+        if old == new:
+            return
+
+        if isinstance(old, dict) and isinstance(new, dict) and \
+                all(map(_is_path_key, new)) and all(map(_is_path_key, old)):
+            for k, v in new.items():
+                if k not in old:
+                    update.setdefault('$set', {})[f'{path}.{k}'] = v
+                else:
+                    cls._diff(old[k], v, f'{path}.{k}', update)
+            for k in old:
+                if k not in new:
+                    update.setdefault('$unset', {})[f'{path}.{k}'] = ''
+            return
+
+        if isinstance(old, list) and isinstance(new, list):
+            n = len(old)
+            if len(new) > n and new[:n] == old:
+                update.setdefault('$push', {})[path] = {'$each': new[n:]}
+                return
+            if len(new) < n:
+                # `$pull` removes every copy of a value, it is only used if that is what happened
+                pulled = [i for i in old if i not in new]
+                if pulled and [i for i in old if i not in pulled] == new:
+                    update.setdefault('$pull', {})[path] = {'$in': pulled}
+                    return
+
+        update.setdefault('$set', {})[path] = new
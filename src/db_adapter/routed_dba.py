@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : routed_dba.py
+
+@Author     : hsn
+
+@Date       : 10/19/26 2:35 AM
+
+@Version    : 1.0.0
+"""
+import threading
+from typing import Callable, Dict
+
+from src.db_adapter.base_dba import AsyncBaseCA, BaseCA, BaseDBA
+from src.util.config_parser import ConfigParser
+from src.util.text import pascal_case_to_under_score
+
+
+class RoutedDBA(BaseDBA):
+    """
+    Open every collection from the adapter named by `/db/collections/<name>/use`, or by `/db/use` if it has none, such
+    as the events from an embedded store and the accounts from Mongo.
+    Every adapter is created once, when the first collection using it is opened, and shared by its collections.
+    """
+
+    def __init__(self, config: ConfigParser, load: Callable[[str], BaseDBA | None]):
+        """
+        :param config: The config of the server.
+        :param load: Create an adapter by its name (in under_score case, like the file of the adapter).
+        """
+        # not an adapter of `/db/adapters`, the config is at `/db/collections`
+        self.global_config = config
+        self.config = ConfigParser(config.get_from_pointer('/db/collections', {}))
+        self.default = config.get_from_pointer('/db/use', 'Mongo')
+        self.load = load
+        self.adapters: Dict[str, BaseDBA] = {}
+        self._lock = threading.Lock()
+
+    def get_adapter(self, collection: str) -> BaseDBA:
+        """
+        Get the adapter of a collection.
+        :param collection:
+        :return:
+        """
+        name = pascal_case_to_under_score(self.config.get_from_pointer(f'/{collection}/use', None) or self.default)
+        with self._lock:
+            if name not in self.adapters:
+                if (dba := self.load(name)) is None:
+                    raise ValueError(f'Unknown database adapter of {collection}: {name}.')
+                self.adapters[name] = dba
+            return self.adapters[name]
+
+    def get_collection(self, collection: str) -> BaseCA:
+        return self.get_adapter(collection).get_collection(collection)
+
+    def get_async_collection(self, collection: str) -> AsyncBaseCA:
+        return self.get_adapter(collection).get_async_collection(collection)
+
+    def close(self):
+        with self._lock:
+            for dba in self.adapters.values():
+                dba.close()
+            self.adapters.clear()
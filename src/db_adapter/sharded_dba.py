@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : sharded_dba.py
+
+@Author     : hsn
+
+@Date       : 10/19/26 3:10 AM
+
+@Version    : 1.0.0
+"""
+import bisect
+import copy
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Mapping
+
+from src.db_adapter.base_dba import BaseCA, BaseDBA, Item
+from src.util.config_parser import ConfigParser
+from src.util.text import pascal_case_to_under_score, under_score_to_pascal_case
+
+# the collection of the first shard keeping the names of the shards the documents were placed with
+MEMBERS_COLLECTION = 'shards'
+
+
+def _hash(value: Any) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _routable(value: Any) -> bool:
+    return isinstance(value, (str, int, float))
+
+
+def _unwrap(item: Item | Mapping[str, Any]) -> Mapping[str, Any]:
+    while isinstance(item, Item):
+        item = item.data
+    return item
+
+
+class _Ring:
+    """
+    A consistent hash ring, every shard has `vnodes` points on it. A key belongs to the first point after its hash, so
+    a new shard only takes about 1/N of the keys, from all the other shards.
+    """
+
+    def __init__(self, names: Iterable[str], vnodes: int):
+        points = sorted((_hash(f'{name}#{i}'), name) for name in names for i in range(vnodes))
+        self.names = [name for _, name in points]
+        self.hashes = [h for h, _ in points]
+        self.members = sorted(set(self.names))
+
+    def owner(self, key: Any) -> str:
+        return self.names[bisect.bisect(self.hashes, _hash(key)) % len(self.hashes)]
+
+
+class ShardedCA(BaseCA):
+    """
+    A collection spread over the shards by its key. A unique key (`/unique-keys`) is also the `_id` of the documents,
+    the others, such as the rid of the events, leave the `_id` to the shards.
+    The operations with the key (or the `_id` if it is the key) in the filter go to the shard owning it, the others go
+    to every shard at once and their results are gathered. The writes of a document take its stripe lock, so it is never moved while it
+    is written and is on exactly one shard then.
+    While the shards are rebalanced, the old owner of a key is asked too.
+    The collections without a natural key are kept on the first shard.
+    """
+
+    def __init__(self, dba: 'ShardedDBA', collection: str):
+        super().__init__(dba.global_config, dba.config, collection)
+        self.dba = dba
+        self.key: str | None = dba.keys.get(collection)
+        self.unique = self.key is not None and collection in dba.unique_keys
+        # the fields a filter is routed by
+        self._route_fields = (self.key, '_id') if self.unique else (self.key,)
+
+    def _ca(self, shard: str) -> BaseCA:
+        ca = self.dba.shards[shard].get_collection(self.collection)
+        if self.ttl is not None and ca.ttl != self.ttl:
+            # a shard added after `set_ttl`
+            ca.set_ttl(*self.ttl)
+        return ca
+
+    def _owners(self, value: Any) -> List[str]:
+        # the old owner first: a document is copied to the new one before it is deleted from the old one, so a
+        # reader missing it on the old owner finds it on the new one
+        ring, old = self.dba.ring, self.dba.old_ring
+        owners = [ring.owner(value)]
+        if old is not None and (o := old.owner(value)) not in owners:
+            owners.insert(0, o)
+        return owners
+
+    def _route(self, filter_: Mapping[str, Any] | None) -> Any:
+        """
+        Get the value a filter is routed by, its key or the `_id` of a unique key, None if it is not routed.
+        """
+        if self.key is None or not isinstance(filter_, Mapping):
+            return None
+        for field in self._route_fields:
+            if _routable(v := filter_.get(field)):
+                return v
+        return None
+
+    def _targets(self, filter_: Mapping[str, Any] | None) -> List[str]:
+        if self.key is None:
+            return [self.dba.home]
+        if (value := self._route(filter_)) is not None:
+            return self._owners(value)
+        return list(self.dba.shards)
+
+    def _gather(self, shards: List[str], func: Callable[[str], Any]) -> List[Any]:
+        """
+        Call `func` with every shard, at once if there are several.
+        """
+        if len(shards) == 1:
+            return [func(shards[0])]
+        return list(self.dba.executor.map(func, shards))
+
+    @staticmethod
+    def _dedupe(docs: Iterable[Mapping[str, Any]]) -> List[Mapping[str, Any]]:
+        # a document being moved can be on two shards for a moment
+        seen = set()
+        rt = []
+        for i in docs:
+            if (_id := i.get('_id')) is not None:
+                if _id in seen:
+                    continue
+                seen.add(_id)
+            rt.append(i)
+        return rt
+
+    def find(self, filter_: Mapping[str, Any] | None = None, masking: Mapping[str, Any] | None = None, limit: int = 0,
+             sort_key: str = "") -> Iterable[Item]:
+        shards = self._targets(filter_)
+        results = self._gather(shards, lambda s: list(self._ca(s).find(filter_=filter_, masking=masking, limit=limit,
+                                                                       sort_key=sort_key)))
+        docs = self._dedupe(i for r in results for i in r)
+        if sort_key and len(shards) > 1:
+            docs.sort(key=lambda i: i.get(sort_key))
+        return docs[:limit] if limit else docs
+
+    def find_one(self, filter_: Mapping[str, Any], masking=None) -> (Item | None):
+        if self._route(filter_) is not None:
+            for shard in self._targets(filter_):
+                if i := self._ca(shard).find_one(filter_=filter_, masking=masking):
+                    return i
+            return None
+        for i in self._gather(self._targets(filter_), lambda s: self._ca(s).find_one(filter_=filter_,
+                                                                                     masking=masking)):
+            if i:
+                return i
+        return None
+
+    def find_many(self, key: str, values: Iterable[Any], masking=None) -> Iterable[Item]:
+        values = list(values)
+        if self.key is not None and key in self._route_fields and all(map(_routable, values)):
+            by_shard: Dict[str, List[Any]] = {}
+            for v in values:
+                for shard in self._owners(v):
+                    by_shard.setdefault(shard, []).append(v)
+        else:
+            by_shard = {shard: values for shard in self._targets(None)}
+        results = self._gather(list(by_shard), lambda s: list(self._ca(s).find_many(key, by_shard[s], masking=masking)))
+        return self._dedupe(i for r in results for i in r)
+
+    def _placed(self, item: Item | Mapping[str, Any]) -> Mapping[str, Any]:
+        """
+        Give a new document its unique key as `_id`, so a filter on `_id` is routed like one on the key.
+        """
+        v = _unwrap(item)
+        if self.key is None:
+            return v
+        if not _routable(value := v.get(self.key)):
+            raise ValueError(f'The documents of {self.collection} need a {self.key} to be sharded by.')
+        if not self.unique:
+            return v
+        if '_id' not in v:
+            return {**v, '_id': value}
+        if v['_id'] != value:
+            raise ValueError(f'The _id of a document of {self.collection} must be its {self.key}: {v["_id"]!r}.')
+        return v
+
+    def _shard_for(self, v: Mapping[str, Any]) -> str:
+        return self.dba.ring.owner(v[self.key]) if self.key is not None else self.dba.home
+
+    def insert_one(self, item: Item | Mapping[str, Any]):
+        v = self._placed(item)
+        if self.key is None:
+            self._ca(self.dba.home).insert_one(v)
+            return
+        with self.dba.stripe(v[self.key]):
+            self._ca(self._shard_for(v)).insert_one(v)
+
+    def insert_many(self, items: Iterable[Item | Mapping[str, Any]]):
+        if self.key is not None:
+            # one at a time, every insert takes the lock of its document
+            for item in items:
+                self.insert_one(item)
+            return
+        self._ca(self.dba.home).insert_many([_unwrap(i) for i in items])
+
+    def _write_one(self, filter_: Mapping[str, Any], write: Callable[[BaseCA, Mapping[str, Any]], Any],
+                   upsert: bool = False):
+        """
+        Write the first document matching the filter, on the shard holding it.
+        :param upsert: Still call `write` on the owner if nothing matches (the update of Zo inserts it then).
+        """
+        if self.key is None:
+            write(self._ca(self.dba.home), filter_)
+            return
+
+        if (value := self._route(filter_)) is None:
+            # find the document first, then write it like one found by its key
+            if not (doc := self.find_one(filter_=filter_)):
+                if upsert:
+                    write(self._ca(self.dba.home), filter_)
+                return
+            value, filter_ = doc.get(self.key), {**filter_, '_id': doc['_id']}
+            if not _routable(value):
+                value = doc['_id']
+
+        with self.dba.stripe(value):
+            owners = self._owners(value)
+            if len(owners) > 1:
+                # the document is on one of them, as it is not moved while its lock is held
+                for shard in owners:
+                    if self._ca(shard).find_one(filter_=filter_):
+                        write(self._ca(shard), filter_)
+                        return
+                if not upsert:
+                    return
+            write(self._ca(owners[-1]), filter_)
+
+    def _write_many(self, filter_: Mapping[str, Any], write: Callable[[BaseCA, Mapping[str, Any]], Any]):
+        if self.key is None:
+            write(self._ca(self.dba.home), filter_)
+        elif (value := self._route(filter_)) is not None:
+            # the documents with a key that is not unique can be several, on the old and the new owner
+            with self.dba.stripe(value):
+                for shard in self._owners(value):
+                    write(self._ca(shard), filter_)
+        else:
+            for doc in self.find(filter_=filter_):
+                self._write_one({**filter_, '_id': doc['_id']}, write)
+
+    def update_one(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self._write_one(filter_, lambda ca, f: ca.update_one(filter_=f, update=update), upsert=True)
+
+    def update_many(self, filter_: Mapping[str, Any], update: Mapping[str, Any]):
+        self._write_many(filter_, lambda ca, f: ca.update_many(filter_=f, update=update))
+
+    def delete_one(self, filter_: Mapping[str, Any]):
+        self._write_one(filter_, lambda ca, f: ca.delete_one(filter_=f))
+
+    def delete_many(self, filter_: Mapping[str, Any]):
+        self._write_many(filter_, lambda ca, f: ca.delete_many(filter_=f))
+
+    def save(self, item: Item) -> bool:
+        try:
+            self.insert_one(item)
+        except Exception:
+            return False
+        else:
+            return True
+
+    def set_ttl(self, field: str, seconds: float):
+        super().set_ttl(field, seconds)
+        for shard in self._targets(None):
+            self.dba.shards[shard].get_collection(self.collection).set_ttl(field, seconds)
+
+    def delete_expired(self) -> int:
+        return sum(self._gather(self._targets(None), lambda s: self._ca(s).delete_expired()))
+
+
+class ShardedDBA(BaseDBA):
+    """
+    Spread the collections over several instances of an adapter (`/db/sharding`).
+
+    The names of the shards the documents were placed with are kept on the first shard. When a shard is appended to
+    the config (or added by `add_shard`), the documents it now owns are moved to it in the background, and both the old
+    and the new owner of a key are used until it is done. Removing a shard is not supported.
+    The documents of the collections with a unique key take it as `_id`, a document with another `_id` is refused.
+    """
+
+    def __init__(self, config: ConfigParser, load: Callable[[str, ConfigParser], BaseDBA | None]):
+        """
+        :param config: The config of the server.
+        :param load: Create an adapter by its name and the config it reads.
+        """
+        # not an adapter of `/db/adapters`, the config is at `/db/sharding`
+        self.global_config = config
+        self.config = ConfigParser(config.get_from_pointer('/db/sharding', {}))
+        self.logger = logging.getLogger(__name__)
+        self.load = load
+        self.adapter = pascal_case_to_under_score(self.config.get_from_pointer('/use', 'Mongo'))
+        self.keys: Dict[str, str] = self.config.get_from_pointer('/keys', {'account': 'user_id', 'event': 'rid',
+                                                                          'group': 'id'})
+        self.unique_keys: List[str] = self.config.get_from_pointer('/unique-keys', ['account', 'group'])
+        self.vnodes = self.config.get_from_pointer('/vnodes', 64)
+        self.executor = ThreadPoolExecutor(max_workers=self.config.get_from_pointer('/workers', 16),
+                                           thread_name_prefix='ShardWorker')
+        self.collections: Dict[str, ShardedCA] = {}
+        self._lock = threading.RLock()
+        # the writes of a document and its move take the lock of its key
+        self._stripes = [threading.Lock() for _ in range(self.config.get_from_pointer('/stripes', 64))]
+        self.rebalancer: threading.Thread | None = None
+
+        self.shards: Dict[str, BaseDBA] = {}
+        for options in self.config.get_from_pointer('/shards', []):
+            self._open_shard(options)
+        if not self.shards:
+            raise ValueError('No shard is configured in /db/sharding/shards.')
+        self.home = next(iter(self.shards))
+        self.ring = _Ring(self.shards, self.vnodes)
+        self.old_ring: _Ring | None = None
+
+        members = self._load_members()
+        if members is None:
+            self._save_members()
+        elif members != self.ring.members:
+            if missing := [i for i in members if i not in self.shards]:
+                raise ValueError(f'The shards {missing} are no longer configured, removing a shard is not supported.')
+            self.old_ring = _Ring(members, self.vnodes)
+            self._start_rebalance()
+
+    def _open_shard(self, options: Mapping[str, Any]) -> str:
+        """
+        Create the adapter of a shard, its options override the ones of the adapter in `/db/adapters`.
+        """
+        name = options['name']
+        if name in self.shards:
+            raise ValueError(f'Duplicate shard: {name}.')
+        data = copy.deepcopy(self.global_config.data)
+        data['db']['adapters'].setdefault(under_score_to_pascal_case(self.adapter), {}).update(
+            {k: v for k, v in options.items() if k != 'name'})
+        if (dba := self.load(self.adapter, ConfigParser(data))) is None:
+            raise ValueError(f'Unknown database adapter of the shards: {self.adapter}.')
+        self.shards[name] = dba
+        return name
+
+    def _load_members(self) -> List[str] | None:
+        if d := self.shards[self.home].get_collection(MEMBERS_COLLECTION).find_one({'name': 'members'}):
+            return list(d['shards'])
+        return None
+
+    def _save_members(self):
+        ca = self.shards[self.home].get_collection(MEMBERS_COLLECTION)
+        ca.delete_one({'name': 'members'})
+        ca.insert_one({'name': 'members', 'shards': self.ring.members})
+
+    def stripe(self, value: Any) -> threading.Lock:
+        """
+        Get the lock of the documents with a key.
+        :param value: The value of the key.
+        :return:
+        """
+        return self._stripes[_hash(value) % len(self._stripes)]
+
+    def add_shard(self, options: Mapping[str, Any]) -> threading.Thread:
+        """
+        Add a shard while the server is running, the documents it owns are moved to it in the background.
+        :param options: The options of the shard, as an item of `/db/sharding/shards`.
+        :return: The thread moving the documents.
+        """
+        with self._lock:
+            if self.rebalancer is not None and self.rebalancer.is_alive():
+                raise RuntimeError('The shards are being rebalanced.')
+            self._open_shard(options)
+            self.old_ring, self.ring = self.ring, _Ring(self.shards, self.vnodes)
+            return self._start_rebalance()
+
+    def _start_rebalance(self) -> threading.Thread:
+        self.rebalancer = threading.Thread(target=self.rebalance, daemon=True, name='ShardRebalancer')
+        self.rebalancer.start()
+        return self.rebalancer
+
+    def rebalance(self):
+        """
+        Move every document to the shard owning it now, then forget the old ring.
+        """
+        moved = 0
+        for collection, key in self.keys.items():
+            for shard in list(self.shards):
+                ca = self.shards[shard].get_collection(collection)
+                for doc in ca.find(filter_={}):
+                    if key in doc and _routable(doc[key]) and (owner := self.ring.owner(doc[key])) != shard:
+                        with self.stripe(doc[key]):
+                            moved += self._move(ca, self.shards[owner].get_collection(collection), doc['_id'])
+        with self._lock:
+            self._save_members()
+            self.old_ring = None
+        self.logger.info(f'Rebalanced the shards {self.ring.members}, {moved} documents moved.')
+
+    @staticmethod
+    def _move(src: BaseCA, dst: BaseCA, _id: Any) -> int:
+        """
+        Copy a document to its new shard, then delete it from the old one. Called with the lock of the document held,
+        so it is not written meanwhile.
+        :return: 1 if it was moved, 0 if it was deleted before.
+        """
+        if not (doc := src.find_one({'_id': _id})):
+            return 0
+        dst.delete_one({'_id': _id})
+        dst.insert_one(dict(doc))
+        src.delete_one({'_id': _id})
+        return 1
+
+    def get_collection(self, collection: str) -> BaseCA:
+        with self._lock:
+            if collection not in self.collections:
+                self.collections[collection] = ShardedCA(self, collection)
+            return self.collections[collection]
+
+    def close(self):
+        if self.rebalancer is not None:
+            self.rebalancer.join()
+        self.executor.shutdown()
+        for dba in self.shards.values():
+            dba.close()
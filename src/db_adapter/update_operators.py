@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : update_operators.py
+
+@Author     : hsn
+
+@Date       : 10/18/26 11:58 PM
+
+@Version    : 1.0.0
+"""
+import copy
+import pickle
+from typing import Any, Mapping
+
+
+def _copy(value: Any) -> Any:
+    return pickle.loads(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def apply_update(doc: Mapping[str, Any], update: Mapping[str, Any]) -> dict:
+    """
+    Apply the update operators (`$set`, `$unset`, `$push` and `$pull`, with dotted paths) to a shallow copy of the
+    document, for the adapters that do not understand them by themselves.
+    The containers on the changed paths are copied, the document itself is not changed.
+    :param doc: The document.
+    :param update: The update operators, as produced by `ChangeTracker`.
+    :return: The new document.
+    """
+    new = dict(doc)
+    copied = set()
+
+    def parent(path: str, create: bool = True):
+        node = new
+        *keys, last = path.split('.')
+        for k in keys:
+            if isinstance(node, list):
+                k = int(k)
+                child = node[k]
+            else:
+                child = node.get(k)
+                if child is None:
+                    if not create:
+                        return None, None
+                    child = {}
+                    copied.add(id(child))
+            if id(child) not in copied:
+                child = copy.copy(child)
+                copied.add(id(child))
+            node[k] = child
+            node = child
+        return node, int(last) if isinstance(node, list) else last
+
+    for path, v in update.get("$set", {}).items():
+        node, k = parent(path)
+        node[k] = _copy(v)
+    for path in update.get("$unset", {}):
+        node, k = parent(path, create=False)
+        if isinstance(node, dict):
+            node.pop(k, None)
+    for path, v in update.get("$push", {}).items():
+        node, k = parent(path)
+        values = v["$each"] if isinstance(v, Mapping) and "$each" in v else [v]
+        node[k] = list(node.get(k) or []) + _copy(values)
+    for path, v in update.get("$pull", {}).items():
+        node, k = parent(path)
+        values = v["$in"] if isinstance(v, Mapping) and "$in" in v else [v]
+        node[k] = [i for i in node.get(k) or [] if i not in values]
+    return new
@@ -26,8 +26,11 @@
 @Version    : 1.0.1
 """
 import importlib
+import logging
+import threading
 from pathlib import Path, PosixPath
-from typing import Union
+from types import MappingProxyType
+from typing import Union, Mapping
 
 import src.util.text
 
@@ -37,6 +40,11 @@ class DynamicObjLoader:
 
         self.group_dict = {}
 
+        # group => immutable table of path => obj, replaced as a whole when the group changes
+        self.route_tables: dict[str, Mapping[str, object]] = {}
+        self._route_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
     @staticmethod
     def load_obj(path: str | PosixPath, obj_name: str = ""):
         path = str(path)
@@ -83,14 +91,61 @@ class DynamicObjLoader:
                 return self.load_obj(module_path.relative_to(Path.cwd()).as_posix(), obj_name=obj_name)
         return None
 
+    def build_route_table(self, group: str = "default") -> Mapping[str, object]:
+        """
+        Scan the paths of the group and build the table used by `get_route`.
+        The paths are relative to the folders of the group, without suffix, such as 'account/login'.
+        """
+        with self._route_lock:
+            table = {}
+            for i in self.group_dict.get(group, []):
+                group_path = Path(i).resolve()
+                if not group_path.is_dir():
+                    continue
+                for module_path in sorted(group_path.rglob('*.py')):
+                    if module_path.stem.startswith('_'):
+                        continue
+                    route = module_path.relative_to(group_path).with_suffix('').as_posix()
+                    # the first folder of the group wins, as in `load_obj_from_group`
+                    if route in table:
+                        continue
+                    try:
+                        obj = self.load_obj(module_path.relative_to(Path.cwd()).as_posix())
+                    except Exception as err:
+                        # a broken module only loses its own route
+                        self.logger.exception(f'Failed to load the route {route} from {module_path}: {err}')
+                        obj = None
+                    if obj is not None:
+                        table[route] = obj
+
+            table = MappingProxyType(table)
+            self.route_tables[group] = table
+        return table
+
+    def get_route(self, path: str, group: str = "default"):
+        """
+        Get an obj from the route table of the group, the table is built on first use.
+        :param path: Such as 'account/login'.
+        :param group:
+        :return: The obj or None.
+        """
+        table = self.route_tables.get(group)
+        if table is None:
+            table = self.build_route_table(group)
+        return table.get(path.strip('/'))
+
     def add_path_to_group(self, group: str = "default", path: Union[str, Path] = ""):
         path_ = path if isinstance(path, str) else path.as_posix()
         existing = self.group_dict.get(group, [])
         existing.append(path_)
         self.group_dict[group] = existing
+        if group in self.route_tables:
+            self.build_route_table(group)
 
     def del_path_from_group(self, group: str = "default", path: Union[str, Path] = ""):
         path_ = path if isinstance(path, str) else path.as_posix()
         existing = self.group_dict.get(group, [])
         existing.remove(path_)
         self.group_dict[group] = existing
+        if group in self.route_tables:
+            self.build_route_table(group)
@@ -32,6 +32,6 @@ class BlockGmWithoutVerification(BaseEvent):
     main_event = SendGroupMsg
 
     def _run(self, friend_id, msg):
-        user = self.server.get_user(self.user_id)
+        user = self.get_user()
         if (user.email is None) and self.server.config.get_from_pointer('/email/enable-email-verification'):
             return True, ReturnData(ReturnData.ERROR, 'Please verify your email first.')
@@ -25,20 +25,20 @@
 from src.containers import ReturnData
 from src.event.base_event import BaseEvent
 from src.event.events.chat.send_friend_msg import SendFriendMsg
+from src.util.text import is_service_id
 
 
 class BlockPmWithoutVerification(BaseEvent):
     auth = True
     main_event = SendFriendMsg
 
-    def _run(self, friend_id, msg):
+    # the msg to service Account is not blocked
+    condition = staticmethod(lambda req: not is_service_id(req.data.get('friend_id')))
 
-        user = self.server.get_user(self.user_id)
+    def _run(self, friend_id, msg):
 
-        # check if the msg is service Account
-        if friend_id[0] in [str(i) for i in range(10)] and friend_id[1] == 's':
-            return False
+        user = self.get_user()
 
-        elif (user.email is None) and self.server.config.get_from_pointer(
+        if (user.email is None) and self.server.config.get_from_pointer(
                 '/email/enable-email-verification'):
             return True, ReturnData(ReturnData.ERROR, 'Please verify your email first.')
@@ -28,13 +28,15 @@
 from src.event.base_event import BaseEvent
 from src.event.events.chat.send_friend_msg import SendFriendMsg
 from src.event.pri_events.service.recv_sv_account_msg import RecvSvAccountMsg
+from src.util.text import is_service_id
 
 
 class SvMsg(BaseEvent):
     auth = True
     main_event = SendFriendMsg
 
+    # only the msg to service Account
+    condition = staticmethod(lambda req: is_service_id(req.data.get('friend_id')))
+
     def _run(self, friend_id, msg):
-        # check if the msg is service Account
-        if friend_id[0] in [str(i) for i in range(10)] and friend_id[1] == 's':
-            return True, self.server.e_mgr.create_event(RecvSvAccountMsg, self.req, self.path)
+        return True, self.server.e_mgr.create_event(RecvSvAccountMsg, self.req, self.path)
@@ -25,17 +25,36 @@
 """
 
 import abc
-import gettext
 import inspect
 import json
 import logging
-import os
+from typing import NamedTuple, Tuple
 
 import src.util.functools
-from src import util
 from src.containers import Request
 from src.containers import ReturnData
 from src.util.command_parser import Command
+from src.util.i18n import get_languages, get_translation
+
+
+class ParamSpec(NamedTuple):
+    """
+    The parameters of an event's `_run`.
+    """
+    names: Tuple[str, ...]
+    required: Tuple[str, ...]
+    var_keyword: bool
+
+    @classmethod
+    def from_func(cls, func) -> "ParamSpec":
+        # skip `self`
+        params = list(inspect.signature(func).parameters.values())[1:]
+        named = [p for p in params if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)]
+        return cls(
+            names=tuple(p.name for p in named),
+            required=tuple(p.name for p in named if p.default is p.empty),
+            var_keyword=any(p.kind == p.VAR_KEYWORD for p in params),
+        )
 
 
 class BaseEvent(metaclass=abc.ABCMeta):
@@ -55,53 +74,68 @@ class BaseEvent(metaclass=abc.ABCMeta):
         # get req_data
         req_data = self.req.data
 
-        # get lang
-        if self.user_id is not None:
-            try:
-                user = self.server.get_user(self.user_id)
-            except KeyError:
-                user = None
-            if user is not None:
-                self.lang = user.language
-
-        if "lang" in req_data and self.lang is None:
-            if req_data["lang"] in os.listdir("locale"):
-                self.lang = req_data["lang"]
-
-        if self.lang is None:
-            self.lang = "en_US"
-
-        l10n = gettext.translation("all", localedir="locale", languages=[self.lang])
-        l10n.install()
-        self.gettext_func = l10n.gettext
+        # get lang, once per request
+        ctx = self.req.ctx
+        if ctx is not None and ctx.lang is not None and ctx.user_id == self.user_id:
+            self.lang = ctx.lang
+        else:
+            user = None
+            if self.user_id is not None:
+                try:
+                    user = self.server.get_user(self.user_id)
+                except KeyError:
+                    user = None
+                if user is not None:
+                    self.lang = user.language
+
+            if "lang" in req_data and self.lang is None:
+                if req_data["lang"] in get_languages():
+                    self.lang = req_data["lang"]
+
+            if self.lang is None:
+                self.lang = "en_US"
+
+            if ctx is not None and ctx.user_id == self.user_id:
+                ctx.lang = self.lang
+                ctx.user = user
+
+        self.gettext_func = get_translation(self.lang).gettext
         _ = self.gettext_func
         # get the parameters of the function
-        params = inspect.signature(self._run).parameters
-        requirements = [i for i in params]
-        m_requirements = list(
-            filter(
-                lambda x: str(params[x].default) == "<class 'inspect._empty'>",
-                requirements,
-            )
-        )
+        spec = self.get_param_spec()
 
         # check if the parameters meet the requirements
-        if util.ins(m_requirements, req_data):
-            if len(requirements) > 0:
-                return self._run(
-                    **{
-                        k: req_data[k]
-                        for k in filter(lambda x: x in requirements, req_data)
-                    }
-                )
-            else:
-                return self._run()
-        else:
-            req_str = ",".join(filter(lambda x: x not in req_data, m_requirements))
+        if missing := [k for k in spec.required if k not in req_data]:
             return ReturnData(
                 ReturnData.ERROR,
-                _("Parameters do not meet the requirements:[{}]").format(req_str),
+                _("Parameters do not meet the requirements:[{}]").format(",".join(missing)),
             )
+        if spec.var_keyword:
+            return self._run(**req_data)
+        return self._run(**{k: req_data[k] for k in spec.names if k in req_data})
+
+    def get_user(self):
+        """
+        Get the user of the event for reading, the snapshot taken by `run` is reused instead of loading it again.
+        Use `update_user_data` to change the user.
+        :return:
+        """
+        ctx = self.req.ctx
+        if ctx is not None and ctx.user is not None and ctx.user_id == self.user_id:
+            return ctx.user
+        return self.server.get_user(self.user_id)
+
+    @classmethod
+    def get_param_spec(cls) -> "ParamSpec":
+        """
+        Get the parameters of `_run`, computed once per class.
+        """
+        # not inherited, a subclass may override `_run`
+        spec = cls.__dict__.get("_param_spec")
+        if spec is None:
+            spec = ParamSpec.from_func(cls._run)
+            cls._param_spec = spec
+        return spec
 
     @abc.abstractmethod
     def _run(self, **kwargs):
@@ -111,6 +145,8 @@ class BaseEvent(metaclass=abc.ABCMeta):
 class BaseEventOfAuxiliary(BaseEvent, metaclass=abc.ABCMeta):
     main_event = None
     priority = 1000
+    # a predicate of the request, the event is skipped without being created if it returns False
+    condition = None
 
 
 class BaseEventOfSVACRecvMsg(BaseEvent, metaclass=abc.ABCMeta):
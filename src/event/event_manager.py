@@ -24,14 +24,21 @@
 #  _
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import asyncio
+import concurrent.futures
+import contextvars
+import inspect
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, Any
 
-from src.containers import ReturnData, Request
+from src.containers import ReturnData, Request, RequestContext
 from src.event.base_event import BaseEventOfAuxiliary, BaseEvent
 from src.util.config_parser import ConfigParser
-from src.util.crypto import JWT
+from src.unit_of_work import detach_unit_of_work
+from src.util.crypto import JWT, TokenCache
 
 
 class EventManager:
@@ -39,6 +46,22 @@ class EventManager:
         self.server = server
         self.logger = logging.getLogger(__name__)
         self.auxiliary_events = {}
+        # main event => ((aux event, condition), ...), sorted by priority
+        self.aux_chains = {}
+
+        # recently verified tokens
+        self.token_cache = TokenCache(self.server.config.get_from_pointer("/sys/token-cache-size", 4096))
+
+        # blocking events of the async pipeline run here
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.server.config.get_from_pointer("/sys/event-workers", 32),
+            thread_name_prefix="EventWorker",
+        )
+
+        # async events reached from the sync pipeline run on this loop, so the async database clients bound to a loop
+        # are reused instead of created for every `asyncio.run`
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
 
     def add_auxiliary_event(
         self, event: BaseEventOfAuxiliary, *, main_event: BaseEvent = None
@@ -49,6 +72,7 @@ class EventManager:
                     self.add_auxiliary_event(event, main_event=i)
             else:
                 self.add_auxiliary_event(event, main_event=event.main_event)
+            return
 
         if main_event not in self.auxiliary_events:
             self.auxiliary_events[main_event] = []
@@ -58,29 +82,23 @@ class EventManager:
             {"evt": event, "priority": event.priority}
         )
 
+        # rebuild the chain of the main event
+        self.aux_chains[main_event] = tuple(
+            (i["evt"], getattr(i["evt"], "condition", None))
+            for i in sorted(self.auxiliary_events[main_event], key=lambda x: x["priority"])
+        )
+
     def create_event(self, event, req: Request, path: str):
         assert isinstance(self.server.config, ConfigParser)
 
-        cancel, rd_of_aux_evt = self._run_aux_events(event, path, req)
-
-        # set the default value of variables
-        auth_success = False
-        auth_data_json = {"user_id": None}
+        # the users and groups loaded by the event chain are shared
+        with self.server.unit_of_work():
+            return self._create_event(event, req, path)
 
-        # check if the 'token' is in `req.cookies`
-        if "Authorization" in req.headers:
-            # get auth data
-            token = req.headers["Authorization"]
-            try:
-                # decode the token
-                auth_data_json: dict[str, Any] = JWT(self.server.key).decode(token)
-                auth_success = True
+    def _create_event(self, event, req: Request, path: str):
+        cancel, rd_of_aux_evt = self._run_aux_events(event, path, req)
 
-            except KeyError as err:
-                auth_success = False
-            except Exception as err:
-                self.logger.exception(err)
-                auth_success = False
+        auth_success, auth_data_json = self._auth(req)
 
         # check if the auth is successful
         if auth_success or (not event.auth):
@@ -92,28 +110,130 @@ class EventManager:
                 # run the code of event
                 e = event(self.server, req, path, auth_data_json["user_id"])
                 rt = e.run()
-            f_rt = rt if rt else rd_of_aux_evt
-            if auth_success:
-                exp = auth_data_json["exp"]
-                if exp - time.time() < 120:
-                    token = JWT(self.server.key).encode(
-                        {"user_id": auth_data_json["user_id"]}
-                    )
-                    f_rt.add("token", token)
-            return f_rt
+                if inspect.iscoroutine(rt):
+                    # an async event reached from the sync pipeline
+                    rt = self.run_coroutine(rt)
+            return self._final_rt(rt, rd_of_aux_evt, auth_success, auth_data_json)
+        else:
+            return ReturnData(ReturnData.ERROR, "Invalid token.")
+
+    async def create_event_async(self, event, req: Request, path: str):
+        """
+        Run an event from an event loop.
+        Blocking events run on the executor, events whose `_run` is a coroutine function run on the loop.
+        """
+        loop = asyncio.get_running_loop()
+        if not is_async_event(event):
+            return await loop.run_in_executor(self.executor, self.create_event, event, req, path)
+
+        # auxiliary events are blocking
+        if self.aux_chains.get(event):
+            cancel, rd_of_aux_evt = await loop.run_in_executor(self.executor, self._run_aux_events, event, path, req)
+        else:
+            cancel, rd_of_aux_evt = False, None
+
+        auth_success, auth_data_json = self._auth(req)
+
+        if auth_success or (not event.auth):
+            rt = None
+            if not cancel:
+                e = event(self.server, req, path, auth_data_json["user_id"])
+                # `run` prepares the event (language etc.) before `_run` and may block
+                rt = await loop.run_in_executor(self.executor, e.run)
+                if inspect.isawaitable(rt):
+                    rt = await rt
+            return self._final_rt(rt, rd_of_aux_evt, auth_success, auth_data_json)
         else:
             return ReturnData(ReturnData.ERROR, "Invalid token.")
 
+    def run_coroutine(self, coro):
+        """
+        Run a coroutine on the loop of the event manager and wait for it, in the context of the caller without its
+        unit of work.
+        """
+        with self._loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True, name="AsyncEventLoop").start()
+
+        future = concurrent.futures.Future()
+        ctx = contextvars.copy_context()
+        ctx.run(detach_unit_of_work)
+
+        def done(task: asyncio.Task):
+            if task.cancelled():
+                future.cancel()
+            elif (err := task.exception()) is not None:
+                future.set_exception(err)
+            else:
+                future.set_result(task.result())
+
+        def start():
+            self.loop.create_task(coro, context=ctx).add_done_callback(done)
+
+        self.loop.call_soon_threadsafe(start)
+        return future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self._loop_lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def create_context(self, req: Request) -> RequestContext:
+        """
+        Create the context of a request, the token is verified here once for the whole event chain.
+        """
+        ctx = RequestContext()
+
+        # check if the 'token' is in `req.headers`
+        if "Authorization" in req.headers:
+            # get auth data
+            token = req.headers["Authorization"]
+            if (auth_data_json := self.token_cache.get(token)) is None:
+                try:
+                    # decode the token
+                    auth_data_json: dict[str, Any] = JWT(self.server.key).decode(token)
+                    self.token_cache.put(token, auth_data_json)
+
+                except KeyError as err:
+                    auth_data_json = None
+                except Exception as err:
+                    self.logger.exception(err)
+                    auth_data_json = None
+
+            if auth_data_json is not None:
+                ctx.auth_success = True
+                ctx.auth_data = auth_data_json
+        return ctx
+
+    def _auth(self, req: Request) -> tuple[bool, dict[str, Any]]:
+        # requests that do not come from `Server.request_handler` get their context here
+        if req.ctx is None:
+            req.ctx = self.create_context(req)
+        return req.ctx.auth_success, req.ctx.auth_data
+
+    def _final_rt(self, rt, rd_of_aux_evt, auth_success: bool, auth_data_json: dict[str, Any]):
+        f_rt = rt if rt else rd_of_aux_evt
+        if auth_success:
+            exp = auth_data_json["exp"]
+            if exp - time.time() < 120:
+                token = JWT(self.server.key).encode(
+                    {"user_id": auth_data_json["user_id"]}
+                )
+                f_rt.add("token", token)
+        return f_rt
+
     def _run_aux_events(self, event, path, req):
         # run auxiliary events
         rd_of_aux_evt = None
         cancel = False
-        # get aux event
-        aux_events: dict = self.auxiliary_events.get(event, [])
-        aux_e_sorted = map(
-            lambda x: x["evt"], sorted(aux_events, key=lambda x: x["priority"])
-        )
-        for e in aux_e_sorted:
+        # get aux event, sorted by priority
+        for e, condition in self.aux_chains.get(event, ()):
+            # skip the event if it does not apply to the request
+            if condition is not None and not condition(req):
+                continue
+
             # get the return value
             aux_evt_rt_tuple = self.create_event(e, req, path)
 
@@ -142,3 +262,10 @@ def _auto_complete(ae_rt_temp: Union[bool, ReturnData, tuple]):
             (ae_rt_temp, None) if isinstance(ae_rt_temp, bool) else (False, ae_rt_temp)
         )
     return ae_rt_temp
+
+
+def is_async_event(event) -> bool:
+    """
+    Check if the event declares itself async, i.e. its `_run` is a coroutine function.
+    """
+    return inspect.iscoroutinefunction(event._run)
@@ -42,9 +42,11 @@ class GetProfile(BaseEvent):
             'gender': user.gender
         }
         if self.user_id is not None:
-            is_fri = self.server.get_user(self.user_id).is_in_contact(user_id)
+            me = self.get_user()
+            is_fri = me.is_in_contact(user_id)
             rt['is_friend'] = is_fri
             if is_fri:
-                rt['nick'] = self.server.get_user(self.user_id).get_friend(user_id)['nick']
-                rt['time'] = self.server.get_user(self.user_id).get_friend(user_id)['time']
+                friend = me.get_friend(user_id)
+                rt['nick'] = friend['nick']
+                rt['time'] = friend['time']
         return ReturnData(ReturnData.OK).add('data', rt)
@@ -31,18 +31,50 @@ from src.event.base_event import BaseEvent
 class GetTodoList(BaseEvent):
     auth = True
 
-    def _run(self):
+    def _run(self, limit=None, cursor=None):
+        """
+        Get the todo_list.
+        :param limit: Get at most `limit` events. Without it the whole todo_list is returned and cleared.
+        :param cursor: The `cursor` returned with the previous page, the events up to it are removed from the todo_list.
+        """
+        _ = self.gettext_func
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                limit = 0
+            if limit <= 0:
+                return ReturnData(ReturnData.ERROR, _('Illegal limit.'))
+
         # add activity
 
         self.server.activity_dict[self.user_id] = 30
 
-        # set status and return the user's todolist
+        # pick the page from a snapshot of the user and read its events without holding the lock of the user
+        todo_list = self.get_user().todo_list
+        if limit is None:
+            page = list(todo_list)
+        else:
+            if cursor is not None and cursor in todo_list:
+                todo_list = todo_list[todo_list.index(cursor) + 1:]
+            page = todo_list[:limit]
+
+        # one query for the whole page, in the order of the todo_list
+        events = {e['rid']: e.data for e in self.server.db_event.find_many('rid', page, masking={'_id': 0})}
+        rt = ReturnData(ReturnData.OK).add('data', [events[i] for i in page if i in events])
+
+        # set status and remove the acknowledged events, the ones added meanwhile stay in the todo_list
         with self.server.update_user_data(self.user_id) as user:
             user.status = 'online'
-            rt_todo_list = []
-            for i in user.todo_list:
-                if (e := self.server.db_event.find_one({'rid': i}, masking={'_id': 0})) is not None:
-                    rt_todo_list.append(e.data)
-            rt = ReturnData(ReturnData.OK).add('data', rt_todo_list)
-            user.todo_list = []
-            return rt
+
+            if limit is None:
+                returned = set(page)
+                user.todo_list = [i for i in user.todo_list if i not in returned]
+            else:
+                if cursor is not None and cursor in user.todo_list:
+                    user.todo_list = user.todo_list[user.todo_list.index(cursor) + 1:]
+                # the page stays in the todo_list until it is acknowledged with the cursor
+                shown = set(page)
+                rt.add('cursor', page[-1] if page else cursor).add('more',
+                                                                   any(i not in shown for i in user.todo_list))
+        return rt
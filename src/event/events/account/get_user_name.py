@@ -33,7 +33,7 @@ from src.event.base_event import BaseEvent
 class GetUserName(BaseEvent):
     auth = False
 
-    def _run(self, user_id: str):
+    async def _run(self, user_id: str):
         _ = self.gettext_func
         if len(user_id) >= 2:
             if user_id[0] in [str(i) for i in range(10)] and user_id[1] == 's':
@@ -45,16 +45,20 @@ class GetUserName(BaseEvent):
         # get nick if logged in
         nick = None
         if self.user_id is not None:
-            with self.server.update_user_data(self.user_id) as user:
+            try:
+                user = await self.server.get_user_async(self.user_id)
+            except KeyError:
+                pass
+            else:
                 if user_id in user.friend_dict:
                     nick = user.friend_dict[user_id]['nick']
 
         # get username
-        if self.server.is_user_exist(user_id):
-            with self.server.update_user_data(user_id) as user:
-                rt = ReturnData(ReturnData.OK).add('data', user.user_name)
-                if nick is not None:
-                    rt.add('nick', nick)
-                return rt
-        else:
+        try:
+            user = await self.server.get_user_async(user_id)
+        except KeyError:
             return ReturnData(ReturnData.NULL, _('User does not exist.'))
+        rt = ReturnData(ReturnData.OK).add('data', user.user_name)
+        if nick is not None:
+            rt.add('nick', nick)
+        return rt
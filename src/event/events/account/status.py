@@ -31,11 +31,12 @@ from src.event.base_event import BaseEvent
 class Status(BaseEvent):
     auth = False
 
-    def _run(self, user_id):
+    async def _run(self, user_id):
         _ = self.gettext_func
         if user_id[0] in [str(i) for i in range(10)] and user_id[1] == 's':
             return ReturnData(ReturnData.OK).add('status', 'online')
-        if not self.server.is_user_exist(user_id):
+        try:
+            user = await self.server.get_user_async(user_id)
+        except KeyError:
             return ReturnData(ReturnData.NULL, _('User does not exist.'))
-        with self.server.update_user_data(user_id) as user:
-            return ReturnData(ReturnData.OK).add('status', str(user.status))
+        return ReturnData(ReturnData.OK).add('status', str(user.status))
@@ -39,7 +39,7 @@ class CreateGroup(BaseEvent):
         group_name_ = group_name
         while True:
             group_id = '0g' + src.util.text.random_str(5, upper=False)
-            if not self.server.db_group.find_one(group_id):
+            if not self.server.db_group.find_one({'id': group_id}):
                 break
         group = Group(group_id)
         with self.server.update_user_data(self.user_id) as user:
@@ -32,7 +32,7 @@ class GetGroups(BaseEvent):
     auth = True
 
     def _run(self):
-        user = self.server.get_user(self.user_id)
+        user = self.get_user()
         data = [
             {
                 "id": i,
@@ -25,13 +25,12 @@
 
 @Version    : 1.0.1
 """
-import gettext
 import logging
-import os
 import re
 
 from src import util
 from src.event.base_event import BaseEventOfSVACRecvMsg
+from src.util.i18n import get_languages, get_translation
 from src.util.regex import regex_email
 
 
@@ -131,16 +130,15 @@ class RecvMsg(BaseEventOfSVACRecvMsg):
                 self.send_msg(_('Command') + ':\\n/lang set [lang]\\n/lang list')
                 return
             if cmd[0] == 'set':
-                if cmd[1] in os.listdir('locale'):
+                if cmd[1] in get_languages():
                     with self.server.update_user_data(self.user_id) as user:
                         user.language = cmd[1]
                     self.lang = cmd[1]
-                    l10n = gettext.translation("all", localedir="locale", languages=[cmd[1]])
-                    l10n.install()
-                    _ = l10n.gettext
+                    self.gettext_func = get_translation(cmd[1]).gettext
+                    _ = self.gettext_func
                     self.send_msg(_('Language set successfully.'))
                 else:
                     self.send_msg(_('Invalid language.'))
 
             elif cmd[0] == 'list':
-                self.send_msg(_('Available language') + ':\\n' + '\\n'.join(os.listdir('locale')))
+                self.send_msg(_('Available language') + ':\\n' + '\\n'.join(get_languages()))
@@ -33,8 +33,11 @@ from src.event.base_event import BaseEvent
 class RecvEvent(BaseEvent):
     auth = False
 
+    def _get_event_class(self):
+        return self.server.dol.get_route(path=self.path, group='req_events')
+
     def _run(self):
-        event_class = self.server.dol.load_obj_from_group(path=self.path, group='req_events')
+        event_class = self._get_event_class()
 
         if event_class is None:
             return ReturnData(ReturnData.NULL, 'No Found.')
@@ -45,3 +48,22 @@ class RecvEvent(BaseEvent):
         except Exception as err:
             logging.exception(err)
             return ReturnData(ReturnData.NULL, 'Internal Server Error.')
+
+
+class AsyncRecvEvent(RecvEvent):
+    """
+    The entry of the async request pipeline.
+    """
+
+    async def _run(self):
+        event_class = self._get_event_class()
+
+        if event_class is None:
+            return ReturnData(ReturnData.NULL, 'No Found.')
+
+        try:
+            return await self.server.e_mgr.create_event_async(event_class, self.req, self.path)
+
+        except Exception as err:
+            logging.exception(err)
+            return ReturnData(ReturnData.NULL, 'Internal Server Error.')
@@ -26,18 +26,23 @@
 @Version    : 1.1.0
 """
 import abc
+import asyncio
 import logging
 import random
 import threading
 
 from src.containers import ReturnData
 from src.util.config_parser import ConfigParser
+from src.util.lock_manager import RequestBarrier
+from src.util.notification_bus import NotificationBus
 
 
 class BaseReceiver(metaclass=abc.ABCMeta):
-    def __init__(self, callback=None, config=None):
+    def __init__(self, callback=None, config=None, async_callback=None, bus=None):
         self.callback = callback
-        self.lock = threading.Lock()
+        self.async_callback = async_callback
+        self.bus: NotificationBus = NotificationBus() if bus is None else bus
+        self.barrier = RequestBarrier()
         self.global_config = config if config is not None else ConfigParser({})
         self.receiver_config = ConfigParser(self.global_config.get_from_pointer(
             f'/network/receivers/{self.__class__.__name__}', {}))
@@ -47,13 +52,14 @@ class BaseReceiver(metaclass=abc.ABCMeta):
         self.logger: logging.Logger = logging.getLogger(type(self).__name__)
 
     def pause(self):
-        self.lock.acquire()
+        self.barrier.pause()
 
     def resume(self):
-        self.lock.release()
+        self.barrier.resume()
 
-    def set_callback(self, callback=None):
+    def set_callback(self, callback=None, async_callback=None):
         self.callback = callback
+        self.async_callback = async_callback
 
     def start(self):
         threading.Thread(target=self._start, daemon=True).start()
@@ -63,11 +69,20 @@ class BaseReceiver(metaclass=abc.ABCMeta):
         ...
 
     def create_req(self, req=None) -> ReturnData:
-        self.lock.acquire()
         rt = ReturnData(ReturnData.ERROR)
-        try:
+        # requests run concurrently, the server locks the users and groups they touch
+        with self.barrier.shared():
             rt = self.callback(req)
-        finally:
-            self.lock.release()
+        # format return data
+        return rt
+
+    async def create_req_async(self, req=None) -> ReturnData:
+        # fall back to the sync callback on the default executor
+        if self.async_callback is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.create_req, req)
+
+        rt = ReturnData(ReturnData.ERROR)
+        async with self.barrier.shared_async():
+            rt = await self.async_callback(req)
         # format return data
         return rt
@@ -29,48 +29,91 @@ import asyncio
 import json
 import ssl
 import uuid
-from typing import Dict
+from typing import Dict, Set
 
-import schedule
 import websockets
 
 from src.containers import Request, ReturnData
 from src.request_receiver.base_receiver import BaseReceiver
+from src.user_event_manager import TODO_CHANGED
 from src.util.i18n import gettext_func as _
 
 
 class WebsocketsWsReceiver(BaseReceiver):
-    connectors: Dict[uuid.UUID, tuple] = {}
-
-    async def send_todo_list(self):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connectors: Dict[uuid.UUID, tuple] = {}
+        self.user_connectors: Dict[str, Set[uuid.UUID]] = {}
+        self.pending_pushes: Set[str] = set()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    async def send_todo_list(self, user_id: str):
         """
-        Send todo_list to all connectors
+        Send todo_list to the connectors of the user
+        :param user_id: The id of user.
         :return:
         """
+        self.pending_pushes.discard(user_id)
+
         # send todo_list
-        for connector in self.connectors.values():
-            auth_data, websocket = connector
+        for _id in list(self.user_connectors.get(user_id, ())):
+            if (connector := self.connectors.get(_id, None)) is None:
+                continue
+            auth_data, websocket, _ = connector
 
             req = Request(
                 path="account/get_todo_list",
                 data={},
                 files=None,
                 cookies={"auth_data": auth_data},
+                headers={"Authorization": auth_data},
             )
-            rt: ReturnData = self.create_req(req)
+            rt: ReturnData = await self.create_req_async(req)
 
             # return todo_list if data is not 'None'
             if rt.json_data.get("data", None):
-                await websocket.send(
-                    json.dumps({"ver": 1, "type": "todo_list", "data": rt.json_data})
-                )
+                try:
+                    await websocket.send(
+                        json.dumps({"ver": 1, "type": "todo_list", "data": rt.json_data})
+                    )
+                except websockets.ConnectionClosed:
+                    pass
+
+    def on_todo_changed(self, user_id: str):
+        """
+        Called by the notification bus from any thread.
+        :param user_id: The id of user.
+        :return:
+        """
+        if self.loop is not None and user_id in self.user_connectors:
+            self.loop.call_soon_threadsafe(self.push_todo_list, user_id)
+
+    def push_todo_list(self, user_id: str):
+        # a push that has not started yet will fetch the new events too
+        if user_id not in self.pending_pushes:
+            self.pending_pushes.add(user_id)
+            self.loop.create_task(self.send_todo_list(user_id))
+
+    def add_connector(self, _id: uuid.UUID, auth_data: str, websocket, user_id: str):
+        self.remove_connector(_id)
+        self.connectors[_id] = (auth_data, websocket, user_id)
+        self.user_connectors.setdefault(user_id, set()).add(_id)
+
+    def remove_connector(self, _id: uuid.UUID):
+        if (connector := self.connectors.pop(_id, None)) is not None:
+            _, _, user_id = connector
+            ids = self.user_connectors.get(user_id, set())
+            ids.discard(_id)
+            if not ids:
+                self.user_connectors.pop(user_id, None)
 
     def _start(self):
         """
         The main function of WS receiver
         :return:
         """
-        schedule.every(1).seconds.do(lambda: asyncio.run(self.send_todo_list()))
+        # push todo_list when it changes instead of polling
+        self.bus.subscribe(TODO_CHANGED, self.on_todo_changed)
 
         self.start_ws_server(self.init_handler())
 
@@ -85,21 +128,27 @@ class WebsocketsWsReceiver(BaseReceiver):
                     path: str = msg_json.get("path", "")
                     data: dict = msg_json.get("data", {})
                     cookies: dict = msg_json.get("cookies", {})
+                    headers: dict = {}
 
                     if c := self.connectors.get(_id, None):
-                        cookies["auth_data"], _ = c
+                        cookies["auth_data"], _, _ = c
+                        headers["Authorization"] = cookies["auth_data"]
 
                     # create request
-                    req = Request(path=path, data=data, files=None, cookies=cookies)
-                    rt: ReturnData = self.create_req(req)
+                    req = Request(path=path, data=data, files=None, cookies=cookies, headers=headers)
+                    rt: ReturnData = await self.create_req_async(req)
 
-                    # if the path is account/login, save the auth_data
+                    # if the path is account/login, save the token
                     if path.startswith("account/login") and (
-                        auth_data := rt.json_data.get("_cookies", {})
-                        .get("auth_data", {})
-                        .get("value", None)
+                        auth_data := rt.json_data.get("token", None)
                     ):
-                        self.connectors[_id] = (auth_data, websocket)
+                        self.add_connector(_id, auth_data, websocket, data.get("user_id"))
+                        # the events received while offline
+                        self.push_todo_list(data.get("user_id"))
+
+                    # the token was renewed
+                    elif c and (auth_data := rt.json_data.get("token", None)):
+                        self.add_connector(_id, auth_data, websocket, c[2])
 
                     # send the return data
                     await websocket.send(
@@ -111,8 +160,7 @@ class WebsocketsWsReceiver(BaseReceiver):
                 websocket.send(ReturnData(ReturnData.ERROR).json_data)
             finally:
                 # remove the connector
-                if _id in self.connectors:
-                    self.connectors.pop(_id)
+                self.remove_connector(_id)
 
         return handler
 
@@ -128,6 +176,7 @@ class WebsocketsWsReceiver(BaseReceiver):
                 ssl_context.load_cert_chain(ssl_cert, keyfile=ssl_key)
                 ssl_kwarg = {"ssl": ssl_context}
                 self.logger.debug(_("WebsocketsWsReceiver started with SSL."))
+            self.loop = asyncio.get_running_loop()
             async with websockets.serve(handler, self.host, self.port, **ssl_kwarg):
                 await asyncio.Future()  # run forever
 
@@ -41,15 +41,20 @@ import schedule
 
 from src.containers import User, ReturnData, Request, Group
 from src.db_adapter.base_dba import BaseDBA
+from src.db_adapter.cached_dba import CachedDBA
+from src.db_adapter.routed_dba import RoutedDBA
+from src.db_adapter.sharded_dba import ShardedDBA
 from src.dynamic_obj_loader import DynamicObjLoader
 from src.event.event_manager import EventManager
-from src.event.recv_event import RecvEvent
+from src.event.recv_event import RecvEvent, AsyncRecvEvent
+from src.unit_of_work import current_unit_of_work, unit_of_work
 from src.user_event_manager import UserEventManager
 from src.util.config_parser import ConfigParser
 from src.util.file_manager import FileManager
 from src.util.i18n import gettext_func as _
 from src.util.jelly import jelly_dump, jelly_load
-from src.util.text import pascal_case_to_under_score
+from src.util.lock_manager import LockManager
+from src.util.notification_bus import NotificationBus
 
 ''' markdown
 > I believe that communication is our freedom and should not be controlled by any country, regime, or corporation.
@@ -66,13 +71,15 @@ class Server:
     def __init__(self, debug: bool = False,
                  name: str = __name__,
                  config: ConfigParser | dict | None = None,
-                 dol: DynamicObjLoader | None = None):
+                 dol: DynamicObjLoader | None = None,
+                 bus: NotificationBus | None = None):
         """
         Initialize the server.
         :param debug:
         :param name: The name of server.
         :param config: Server config.
         :param dol: DynamicObjLoader.
+        :param bus: NotificationBus.
         """
         # Get logger
         self.running = True
@@ -107,12 +114,16 @@ class Server:
         self.event_timeout = self.config.get_from_pointer('/sys/event-timeout', 7 * 24 * 60 * 60)  # 1 week
         self.short_id_timeout = self.config.get_from_pointer('/sys/sid-timeout', 5 * 60)  # 5 minutes
 
+        # Lock users and groups per entity, so requests touching different ones can run in parallel
+        self.lock_mgr = LockManager()
+
         # Keep track of active users
         self.activity_dict: Dict[str, int] = {}
 
-        # Get DBA
-        dba_name = pascal_case_to_under_score(self.config.get_from_pointer('/db/use', 'Mongo'))
-        self.dba: BaseDBA = self.dol.load_obj_from_group(dba_name, group='db_adapters')(config=self.config)
+        # Get DBA, the collections can come from different adapters
+        self.dba: BaseDBA = RoutedDBA(self.config, self._load_dba)
+        if self.config.get_from_pointer('/db/cache/enable', False):
+            self.dba = CachedDBA(self.config, self.dba)
 
         # Initialize databases
         self.db_account = self.dba['account']
@@ -120,13 +131,21 @@ class Server:
         self.db_group = self.dba['group']
         self.db_email = self.dba['email']
         self.db_file_info = self.dba['file_info']
+        # the same collections for the async events
+        self.adb_account = self.dba.get_async_collection('account')
+        self.adb_event = self.dba.get_async_collection('event')
+        self.adb_group = self.dba.get_async_collection('group')
+
+        # Let the database expire events, so the cleaner only touches the expired ones
+        self.db_event.set_ttl('time', self.event_timeout)
 
         # Initialize file manager
         self.upload_folder = FileManager(self.config.get_from_pointer('/network/upload/upload_folder', 'static/files'),
                                          self.db_file_info)
 
         # Crate user event manager
-        self.uem = UserEventManager(database=self.db_event)
+        self.bus = NotificationBus() if bus is None else bus
+        self.uem = UserEventManager(database=self.db_event, bus=self.bus)
 
         # Initialize sid table
         self.event_sid_table: Dict[str, str] = {}
@@ -138,11 +157,25 @@ class Server:
         :return:
         """
         req = Request() if req is None else req
+        req.ctx = self.e_mgr.create_context(req)
 
         rt = self.e_mgr.create_event(RecvEvent, req, req.path)
 
         return rt if isinstance(rt, ReturnData) else ReturnData(ReturnData.OK, rt)
 
+    async def request_handler_async(self, req: Request):
+        """
+        The handler of requests from an event loop.
+        :param req:
+        :return:
+        """
+        req = Request() if req is None else req
+        req.ctx = self.e_mgr.create_context(req)
+
+        rt = await self.e_mgr.create_event_async(AsyncRecvEvent, req, req.path)
+
+        return rt if isinstance(rt, ReturnData) else ReturnData(ReturnData.OK, rt)
+
     def _schedule_activity_list(self):
         """
         Check the online status of users.
@@ -162,13 +195,9 @@ class Server:
     def _schedule_cleaner(self):
         # Remove expired events from the event database
 
-        del_e_count = 0
         del_sid_count = 0
 
-        for i in self.db_event.find({}):
-            if i and time.time() - i['time'] > self.event_timeout:
-                self.db_event.delete_one({'_id': i['_id']})
-                del_e_count += 1
+        del_e_count = self.db_event.delete_expired()
 
         for k, v in list(self.event_sid_table.items()):
             try:
@@ -236,6 +265,21 @@ class Server:
             schedule.run_pending()
             time.sleep(0.1)
 
+    def _load_dba(self, name: str, config: ConfigParser | None = None) -> BaseDBA | None:
+        """
+        Create a database adapter.
+        :param name: The name of the adapter, such as 'mongo', or 'sharded' for the shards of `/db/sharding`.
+        :param config: The config the adapter reads, the one of the server by default.
+        :return:
+        """
+        if config is None:
+            config = self.config
+        if name == 'sharded':
+            return ShardedDBA(config, self._load_dba)
+        if (dba_class := self.dol.load_obj_from_group(name, group='db_adapters')) is None:
+            return None
+        return dba_class(config=config)
+
     def close(self):
         """
         Close the server.
@@ -244,6 +288,7 @@ class Server:
         # save data and exit
         self.logger.info(_('Saving data...'))
         self.dba.close()
+        self.e_mgr.close()
         self.running = False
 
         self.logger.info(_('Server closed.'))
@@ -255,29 +300,80 @@ class Server:
         :param user_id: The id of user.
         :return:
         """
-        with self.db_account.enter_one({'user_id': user_id}) as i:
+        # notified once the user with the new todos is written back, not at all if that fails
+        if (uow := current_unit_of_work()) is not None:
+            with self.uem.defer_notifications(), \
+                    uow.update('account', user_id, self.db_account, {'user_id': user_id}) as user:
+                yield user
+            return
+
+        with self.uem.defer_notifications(), self.lock_mgr.lock('account', user_id), \
+                self.db_account.enter_one({'user_id': user_id}) as i:
             user: User = jelly_load(i.data)
             yield user
             i.data = jelly_dump(user)
 
+    @contextlib.contextmanager
+    def unit_of_work(self):
+        """
+        Load every user and group at most once until the unit of work is closed, the changes are written back when
+        their `update_*_data` block exits. Nested calls join the open unit of work. The users are notified of their new
+        todos after they are written back, nothing is published if the block raises.
+        :return:
+        """
+        with self.uem.defer_notifications(), unit_of_work(self.lock_mgr) as uow:
+            yield uow
+
     def new_user(self, user: User):
         self.db_account.insert_one(jelly_dump(user))
 
     def get_user(self, user_id: str) -> User:
+        if (uow := current_unit_of_work()) is not None:
+            if (user := uow.get('account', user_id, self.db_account, {'user_id': user_id})) is None:
+                raise KeyError('User not found.')
+            return user
+
         if d := self.db_account.find_one({'user_id': user_id}):
             return jelly_load(d.data)
         else:
             raise KeyError('User not found.')
 
+    async def get_user_async(self, user_id: str) -> User:
+        """
+        Get a user from an event loop, the changes to it are not saved.
+        :param user_id: The id of user.
+        :return:
+        """
+        if d := await self.adb_account.find_one({'user_id': user_id}):
+            return jelly_load(d.data)
+        else:
+            raise KeyError('User not found.')
+
     def new_group(self, group: Group):
         self.db_group.insert_one(jelly_dump(group))
 
     def get_group(self, group_id: str) -> Group:
+        if (uow := current_unit_of_work()) is not None:
+            if (group := uow.get('group', group_id, self.db_group, {'id': group_id})) is None:
+                raise KeyError('Group not found.')
+            return group
+
         if d := self.db_group.find_one({'id': group_id}):
             return jelly_load(d.data)
         else:
             raise KeyError('Group not found.')
 
+    async def get_group_async(self, group_id: str) -> Group:
+        """
+        Get a group from an event loop, the changes to it are not saved.
+        :param group_id: The id of group.
+        :return:
+        """
+        if d := await self.adb_group.find_one({'id': group_id}):
+            return jelly_load(d.data)
+        else:
+            raise KeyError('Group not found.')
+
     @contextlib.contextmanager
     def update_group_data(self, group_id: str):
         """
@@ -285,7 +381,12 @@ class Server:
         :param group_id: The id of group.
         :return:
         """
-        with self.db_group.enter_one({'id': group_id}) as i:
+        if (uow := current_unit_of_work()) is not None:
+            with uow.update('group', group_id, self.db_group, {'id': group_id}) as group:
+                yield group
+            return
+
+        with self.lock_mgr.lock('group', group_id), self.db_group.enter_one({'id': group_id}) as i:
             group: Group = jelly_load(i.data)
             yield group
             i.data = jelly_dump(group)
@@ -36,6 +36,7 @@ from src.plugin_manager import PluginManager
 from src.server import Server
 from src.util.config_parser import ConfigParser
 from src.util.i18n import gettext_func as _
+from src.util.notification_bus import NotificationBus
 
 
 class ServerManager:
@@ -61,6 +62,9 @@ class ServerManager:
         self.server = {}
         self.receivers = {}
 
+        # shared by the server and the receivers, and kept when the server restarts
+        self.bus = NotificationBus()
+
         self.server_kwargs = server_kwargs
 
         # Load update service
@@ -117,6 +121,7 @@ class ServerManager:
         if server_kwargs is None:
             server_kwargs = {}
         server_kwargs['dol'] = self.dol
+        server_kwargs['bus'] = self.bus
 
         # Init the server.
         s = Server(**server_kwargs)
@@ -128,6 +133,9 @@ class ServerManager:
                          .format(plugin_info.get_from_pointer('/name', 'Unknown'),
                                  plugin_info.get_from_pointer('/version', '0.0.0.0')))
 
+        # Build the routes of requests, including the events of plugins
+        self.dol.build_route_table('req_events')
+
         # Start the thread of server.
         t = threading.Thread(target=s.server_forever, name='ServerThread')
         t.start()
@@ -143,13 +151,23 @@ class ServerManager:
             req = Request()
         return self.server['server'].request_handler(req)
 
+    async def request_async(self, req: Request) -> ReturnData:
+        """
+        The handler of request from an event loop.
+        :param req: The request.
+        :return:
+        """
+        if req is None:
+            req = Request()
+        return await self.server['server'].request_handler_async(req)
+
     def load_receivers(self):
         """
         Load receivers.
         :return:
         """
         for i in self.dol.load_objs_from_group("receiver"):
-            receiver = i(self.request, self.config)
+            receiver = i(self.request, self.config, async_callback=self.request_async, bus=self.bus)
             if receiver.enable:
                 receiver.start()
 
@@ -179,11 +197,11 @@ class ServerManager:
         :return:
         """
         self.close()
-        for i in self.receivers:
+        for i in self.receivers.values():
             i.pause()
 
         subprocess.run(['git', 'pull'], check=True)
 
         self.start()
-        for i in self.receivers:
+        for i in self.receivers.values():
             i.resume()
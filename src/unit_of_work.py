@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  _
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  _
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  _
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : unit_of_work.py
+
+@Author     : hsn
+
+@Date       : 10/18/26 7:12 PM
+
+@Version    : 1.0.0
+"""
+import contextlib
+import contextvars
+import pickle
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Mapping, Tuple
+
+from src.db_adapter.base_dba import BaseCA
+from src.db_adapter.change_tracker import ChangeTracker
+from src.util.jelly import Jelly, jelly_dump, jelly_load
+from src.util.lock_manager import LockManager
+
+_current_uow: contextvars.ContextVar['UnitOfWork | None'] = contextvars.ContextVar('current_uow', default=None)
+
+
+@dataclass
+class _Entry:
+    ca: BaseCA
+    obj: Jelly
+    tracker: ChangeTracker | None
+    # the entity lock, held while the document is opened for update
+    lock: Any = None
+    opened: int = 0
+
+
+class UnitOfWork:
+    """
+    An identity map of the documents (users, groups) used by one request.
+
+    Every document is read at most once for reading. A document opened for update is loaded again under its entity
+    lock, its changes are written back and the lock is released when the outermost `update` block of it exits, so a
+    request only holds the locks of the `with` blocks it is in, like the code without a unit of work.
+    """
+
+    def __init__(self, lock_mgr: LockManager):
+        self.lock_mgr = lock_mgr
+        self._entries: Dict[Tuple[str, Hashable], _Entry] = {}
+
+    def get(self, namespace: str, key: Hashable, ca: BaseCA, filter_: Mapping[str, Any]) -> Jelly | None:
+        """
+        Get a document, loading it if it is not in the map yet.
+        :param namespace: The lock namespace of the document, such as 'account'.
+        :param key: The natural key of the document, such as the id of user.
+        :param ca: The collection of the document.
+        :param filter_: The filter to find the document.
+        :return: The object, None if not found.
+        """
+        if entry := self._entries.get((namespace, key)):
+            return entry.obj
+        if entry := self._load(namespace, key, ca, filter_):
+            return entry.obj
+        return None
+
+    @contextlib.contextmanager
+    def update(self, namespace: str, key: Hashable, ca: BaseCA, filter_: Mapping[str, Any]):
+        """
+        Open a document for update. The changes are written back when the outermost block of the document exits. If
+        the block raises, the document is restored as it was when the block was entered.
+        :param namespace: The lock namespace of the document, such as 'account'.
+        :param key: The natural key of the document, such as the id of user.
+        :param ca: The collection of the document.
+        :param filter_: The filter to find the document.
+        :return:
+        """
+        entry = self._entries.get((namespace, key))
+        if entry is None or entry.lock is None:
+            # a snapshot read without the lock may be stale, load it again under the lock
+            lock = self.lock_mgr.get_lock(namespace, key)
+            lock.acquire()
+            try:
+                entry = self._load(namespace, key, ca, filter_, locked=True)
+            except BaseException:
+                lock.release()
+                raise
+            if entry is None:
+                lock.release()
+                raise KeyError('Document not found.')
+            entry.lock = lock
+
+        entry.opened += 1
+        snapshot = pickle.dumps(jelly_dump(entry.obj), protocol=pickle.HIGHEST_PROTOCOL)
+        ok = False
+        try:
+            yield entry.obj
+            ok = True
+        except BaseException:
+            entry.obj.__setstate__(pickle.loads(snapshot))
+            raise
+        finally:
+            entry.opened -= 1
+            if entry.opened == 0:
+                self._unlock(namespace, key, entry, write=ok)
+
+    def close(self):
+        """
+        Release the locks still held, such as by a generator that was not closed, and forget the documents.
+        :return:
+        """
+        for entry in self._entries.values():
+            if entry.lock is not None:
+                entry.lock.release()
+                entry.lock = None
+        self._entries.clear()
+
+    def _unlock(self, namespace: str, key: Hashable, entry: _Entry, write: bool):
+        try:
+            if write:
+                self._flush_entry(entry)
+        except BaseException:
+            # not written, read it again next time
+            if self._entries.get((namespace, key)) is entry:
+                del self._entries[(namespace, key)]
+            raise
+        finally:
+            lock, entry.lock = entry.lock, None
+            lock.release()
+
+    def _load(self, namespace: str, key: Hashable, ca: BaseCA, filter_: Mapping[str, Any],
+              locked: bool = False) -> _Entry | None:
+        if not (d := ca.find_one_for_update(filter_=filter_) if locked else ca.find_one(filter_=filter_)):
+            self._entries.pop((namespace, key), None)
+            return None
+        tracker = ChangeTracker(d.data) if locked else None
+        entry = _Entry(ca=ca, obj=jelly_load(d.data), tracker=tracker)
+        self._entries[(namespace, key)] = entry
+        return entry
+
+    @staticmethod
+    def _flush_entry(entry: _Entry):
+        new = jelly_dump(entry.obj)
+        if update := entry.tracker.diff(new):
+            entry.ca.update_one(filter_={'_id': entry.tracker.id}, update=update)
+            entry.tracker = ChangeTracker({**new, '_id': entry.tracker.id})
+
+
+def current_unit_of_work() -> UnitOfWork | None:
+    """
+    Get the unit of work of the running request.
+    :return:
+    """
+    return _current_uow.get()
+
+
+def detach_unit_of_work():
+    """
+    Leave the unit of work in the current context, such as in a copy of the context running on another thread, which
+    must not use the identity map and the locks of the thread owning it.
+    :return:
+    """
+    _current_uow.set(None)
+
+
+@contextlib.contextmanager
+def unit_of_work(lock_mgr: LockManager):
+    """
+    Open a unit of work for the current context, or join the one already open.
+    :param lock_mgr: The lock manager of the server.
+    :return:
+    """
+    if (uow := _current_uow.get()) is not None:
+        yield uow
+        return
+
+    uow = UnitOfWork(lock_mgr)
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+    finally:
+        _current_uow.reset(token)
+        uow.close()
@@ -22,20 +22,74 @@
 
 @Date       : 10/17/23 9:34 PM
 """
+import contextlib
+import contextvars
 from functools import partial
+from typing import List
 
 from src.containers import UserEvent
 from src.db_adapter.base_dba import BaseCA
+from src.util.notification_bus import NotificationBus
+
+# published with the user id when an event is added to the user's todo_list
+TODO_CHANGED = 'user_tl_is_changed'
+
+# the users to notify when the innermost `defer_notifications` block exits
+_deferred: contextvars.ContextVar[List[str] | None] = contextvars.ContextVar('deferred_notifications', default=None)
 
 
 class UserEventManager:
-    def __init__(self, database: BaseCA):
+    def __init__(self, database: BaseCA, bus: NotificationBus | None = None):
         self.db = database
+        self.bus = NotificationBus() if bus is None else bus
 
     def create_event(self) -> UserEvent:
         ue = UserEvent()
         ue.write_in = partial(self.write_in, ue)
+        ue.notify = partial(self.notify, ue)
         return ue
 
     def write_in(self, event: UserEvent):
         self.db.insert_one(event.json)
+        event.written = True
+
+        # the event can be fetched now
+        for user_id in event.receivers:
+            self._publish(user_id)
+
+    def notify(self, event: UserEvent, user_id: str):
+        event.receivers.append(user_id)
+
+        # wait for `write_in` if the event is not in the database yet
+        if event.written:
+            self._publish(user_id)
+
+    def _publish(self, user_id: str):
+        if (pending := _deferred.get()) is not None:
+            if user_id not in pending:
+                pending.append(user_id)
+        else:
+            self.bus.publish(TODO_CHANGED, user_id)
+
+    @contextlib.contextmanager
+    def defer_notifications(self):
+        """
+        Hold the notifications of the block until it exits, such as until the user document with the new todo is
+        written back. Otherwise a client could fetch its todo_list before it has the event. A nested block hands its
+        notifications to the enclosing one, the ones of a block that raises (such as a failed write back) are dropped.
+        :return:
+        """
+        outer = _deferred.get()
+        pending: List[str] = []
+        token = _deferred.set(pending)
+        try:
+            yield
+        finally:
+            _deferred.reset(token)
+
+        # the block did not raise
+        if outer is not None:
+            outer.extend(i for i in pending if i not in outer)
+            return
+        for user_id in pending:
+            self.bus.publish(TODO_CHANGED, user_id)
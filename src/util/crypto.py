@@ -31,7 +31,9 @@ import inspect
 import io
 import pathlib
 import secrets
+import threading
 import time
+from collections import OrderedDict
 from os import PathLike
 from pathlib import Path
 from typing import IO, Generator, Any
@@ -108,6 +110,48 @@ class JWT:
         return jwt.decode(token, key=self.key, algorithms=["HS256"])
 
 
+class TokenCache:
+    """
+    A bounded LRU of verified tokens, an entry expires at the `exp` of its token.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._tokens: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        """
+        Get the payload of a verified token.
+        :param token: The token.
+        :return: The payload, or None if the token is not cached or expired.
+        """
+        with self._lock:
+            payload = self._tokens.get(token)
+            if payload is None:
+                return None
+            if payload["exp"] <= time.time():
+                del self._tokens[token]
+                return None
+            self._tokens.move_to_end(token)
+            return payload
+
+    def put(self, token: str, payload: dict[str, Any]):
+        """
+        Cache the payload of a verified token.
+        :param token: The token.
+        :param payload: The payload returned by `JWT.decode`.
+        :return:
+        """
+        if self.maxsize <= 0 or "exp" not in payload:
+            return
+        with self._lock:
+            self._tokens[token] = payload
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+
+
 def _get_hasher(method="sha256"):
     if hasattr(hashlib, method):
         hasher = getattr(hashlib, method)
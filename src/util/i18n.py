@@ -25,8 +25,10 @@
 
 @Version    : 1.0.0
 """
+import functools
 import gettext
 import os
+from typing import Tuple
 
 appName = 'all'
 languageDir = os.path.abspath('locale')
@@ -34,3 +36,23 @@ gettext.bindtextdomain(appName, languageDir)
 gettext.textdomain(appName)
 
 gettext_func = gettext.gettext
+
+
+@functools.cache
+def get_languages() -> Tuple[str, ...]:
+    """
+    Get the available languages, the locale folder is read once.
+    :return:
+    """
+    return tuple(sorted(os.listdir(languageDir)))
+
+
+@functools.lru_cache(maxsize=32)
+def get_translation(lang: str) -> gettext.NullTranslations:
+    """
+    Get the catalog of the language, without installing it into builtins.
+    Catalogs are read-only once loaded, so one can be shared by concurrent requests.
+    :param lang: Such as 'en_US'.
+    :return:
+    """
+    return gettext.translation(appName, localedir=languageDir, languages=[lang], fallback=True)
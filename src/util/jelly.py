@@ -7,12 +7,14 @@
 
 @Date       : 01/15/2023(MM/DD/YYYY)
 
-@Version    : 2.0.1
+@Version    : 2.1.0
 
 @Description: A class for pickling and unpickling instances of itself
 """
+import inspect
+import types
 from collections.abc import MutableSet, Hashable
-from typing import Mapping, Any
+from typing import Mapping, Any, Callable, Dict
 
 
 # Copyright 2023. hsn
@@ -30,10 +32,21 @@ from typing import Mapping, Any
 # limitations under the License.
 
 
+# the `_obj_type` of the documents => the class, filled when a subclass of Jelly is defined
+_types: Dict[str, type] = {}
+
+
 class Jelly:
     """
     A class for pickling and unpickling instances of itself
     """
+    # the subclasses without `__slots__` still get a `__dict__`
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # only the subclasses of Jelly can be created by `jelly_load`
+        _types[f'{cls.__module__}.{cls.__name__}'] = cls
 
     def __init__(self):
         self._var_init()
@@ -46,34 +59,19 @@ class Jelly:
         """
         Get a list of all non-method instance variables
         """
-        return [i for i in dir(self) if not i.startswith('__') and not callable(getattr(self, i))]
+        return list(_schema(type(self)).dump(self))
 
     def __getstate__(self):
         """
         Get the state of the object for pickling
         """
-        state = {k: getattr(self, k) for k in self._get_instance_variables()}
-
-        # set => list
-        sg = map(lambda x: (
-            x[0], {"_obj_type": ".UserSet", "data": list(x[1])}
-            if isinstance(x[1], (set, UserSet))
-            else x[1]
-        ), state.items())
-
-        return dict(sg)
+        return _schema(type(self)).dump(self)
 
     def __setstate__(self, state):
         """
         Set the state of the object after unpickling
         """
-        self._var_init()
-
-        for k, v in state.items():
-            if isinstance(v, dict) and "_obj_type" in v:
-                v = jelly_load(v)
-
-            setattr(self, k, v)
+        _schema(type(self)).load_into(self, state)
 
 
 class UserSet(Hashable, MutableSet, Jelly):
@@ -119,19 +117,132 @@ class UserSet(Hashable, MutableSet, Jelly):
         self.data.discard(item)
 
 
+# the UserSets of the documents are named without their module
+_types['.UserSet'] = UserSet
+
+
+def _wrap_set(value) -> dict:
+    # set => list
+    return {"_obj_type": ".UserSet", "data": list(value)}
+
+
+class _SetTypes(dict):
+    """
+    Whether a type is dumped as a UserSet, by type: `isinstance` on the ABC of UserSet is slow for the other values.
+    """
+
+    def __missing__(self, key: type) -> bool:
+        self[key] = rt = issubclass(key, (set, UserSet))
+        return rt
+
+
+_is_set = _SetTypes()
+
+
+class _Schema:
+    """
+    The fields of a Jelly class, found once per class instead of running `dir` on every instance, and a `dump`
+    function generated for them.
+
+    The fields are the slots, the non-callable class attributes (such as constants and properties) and whatever is in
+    the `__dict__` of the instance.
+    """
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        self.type_name = f'{cls.__module__}.{cls.__name__}'
+        self.slots: list[str] = []
+        self.fields: list[str] = []
+        self.has_dict = cls.__dictoffset__ != 0
+        for name in dir(cls):
+            if name.startswith('__'):
+                continue
+            if isinstance(inspect.getattr_static(cls, name), types.MemberDescriptorType):
+                self.slots.append(name)
+                continue
+            try:
+                if callable(getattr(cls, name)):
+                    continue
+            except AttributeError:
+                # a descriptor only working on instances
+                pass
+            self.fields.append(name)
+
+        self.dump = self._make_dump()
+        # a subclass with its own `__getstate__` is dumped by it
+        self.getstate: Callable[[Jelly], dict] = cls.__getstate__ \
+            if cls.__getstate__ is not Jelly.__getstate__ else self.dump
+
+    def _make_dump(self) -> Callable[[Jelly], dict]:
+        value = '_wrap_set(v) if _is_set[type(v)] else v'
+        lines = ['def dump(o):', '    state = {}']
+        for name in self.slots:
+            # an unset slot is left out, like a missing attribute
+            lines += ['    try:',
+                      f'        v = o.{name}',
+                      '    except AttributeError:',
+                      '        pass',
+                      '    else:',
+                      f'        state[{name!r}] = {value}']
+        for name in self.fields:
+            lines += [f'    v = o.{name}',
+                      f'    state[{name!r}] = {value}']
+        if self.has_dict:
+            lines += ['    for k, v in o.__dict__.items():',
+                      '        if not k.startswith("__") and not callable(v):',
+                      f'            state[k] = {value}']
+        lines.append('    return state')
+
+        namespace = {'_wrap_set': _wrap_set, '_is_set': _is_set}
+        exec('\n'.join(lines), namespace)
+        return namespace['dump']
+
+    def load_into(self, obj: Jelly, state: Mapping[str, Any]):
+        obj._var_init()
+        for k, v in state.items():
+            if k == '_obj_type':
+                continue
+            if isinstance(v, dict) and "_obj_type" in v:
+                v = jelly_load(v)
+            setattr(obj, k, v)
+
+    def load(self, state: Mapping[str, Any]) -> Jelly:
+        obj = self.cls.__new__(self.cls)
+        if self.cls.__setstate__ is not Jelly.__setstate__:
+            obj.__setstate__(state)
+        else:
+            self.load_into(obj, state)
+        return obj
+
+
+_schemas: Dict[type, _Schema] = {}
+
+
+def _schema(cls: type) -> _Schema:
+    try:
+        return _schemas[cls]
+    except KeyError:
+        # building it twice at once is harmless
+        return _schemas.setdefault(cls, _Schema(cls))
+
+
 def jelly_dump(_class: Jelly):
-    return {'_obj_type': f'{_class.__module__}.{_class.__class__.__name__}', **_class.__getstate__()}
+    schema = _schema(type(_class))
+    return {'_obj_type': schema.type_name, **schema.getstate(_class)}
+
+
+def _resolve(obj_type: str) -> type:
+    """
+    Get the class of an `_obj_type`. Only the subclasses of Jelly that are defined can be created, nothing is imported
+    for the names found in the data.
+    :param obj_type: Such as 'src.containers.User'.
+    :return:
+    """
+    try:
+        return _types[obj_type]
+    except (KeyError, TypeError):
+        raise ValueError(f'Unknown jelly type: {obj_type!r}.') from None
 
 
 def jelly_load(_dict: Mapping[str, Any]):
-    if (name := _dict['_obj_type'].rsplit('.', 1))[0]:
-        module_name, class_name = name
-        module = __import__(module_name, fromlist=[class_name])
-        class_ = getattr(module, class_name)
-    else:
-        class_name = name[1]
-        class_ = globals()[class_name]
-
-    obj = class_.__new__(class_)
-    obj.__setstate__(_dict)
-    return obj
+    return _schema(_resolve(_dict['_obj_type'])).load(_dict)
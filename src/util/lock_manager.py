@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  _
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  _
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  _
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : lock_manager.py
+
+@Author     : hsn
+
+@Date       : 10/18/26 2:10 PM
+
+@Version    : 1.0.0
+"""
+import asyncio
+import contextlib
+import threading
+import weakref
+from typing import Hashable, Tuple
+
+
+class LockManager:
+    """
+    Reentrant locks keyed by entity.
+
+    Every key of a namespace (such as 'account' or 'group') has a lock of its own, so requests that touch different
+    entities never wait for each other. A lock lives as long as somebody refers to it, keep the lock returned by
+    `get_lock` while it is held instead of getting it again to release it.
+    The locks of a request are nested as the `with` blocks are, a group before its users.
+    """
+
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary[Tuple[str, Hashable], threading.RLock] = \
+            weakref.WeakValueDictionary()
+        self._mutex = threading.Lock()
+
+    def get_lock(self, namespace: str, key: Hashable) -> threading.RLock:
+        """
+        Get the lock of the key.
+        :param namespace: The namespace of the key, such as 'account'.
+        :param key: The key, such as the id of user.
+        :return:
+        """
+        with self._mutex:
+            if (lock := self._locks.get((namespace, key))) is None:
+                lock = self._locks[(namespace, key)] = threading.RLock()
+            return lock
+
+    @contextlib.contextmanager
+    def lock(self, namespace: str, key: Hashable):
+        """
+        Hold the lock of the key.
+        :param namespace: The namespace of the key, such as 'account'.
+        :param key: The key, such as the id of user.
+        :return:
+        """
+        with self.get_lock(namespace, key):
+            yield
+
+
+class RequestBarrier:
+    """
+    A shared/exclusive barrier.
+
+    Requests enter it in shared mode and run concurrently, `pause()` waits for the requests in flight to finish and
+    blocks new ones until `resume()` is called.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._active = 0
+        self._paused = False
+
+    @contextlib.contextmanager
+    def shared(self):
+        """
+        Enter the barrier as a request.
+        :return:
+        """
+        with self._cond:
+            while self._paused:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            self._leave()
+
+    @contextlib.asynccontextmanager
+    async def shared_async(self):
+        """
+        Enter the barrier as a request from an event loop, without blocking the loop while paused.
+        :return:
+        """
+        while not self._try_enter():
+            await asyncio.sleep(0.1)
+        try:
+            yield
+        finally:
+            self._leave()
+
+    def _try_enter(self) -> bool:
+        with self._cond:
+            if self._paused:
+                return False
+            self._active += 1
+            return True
+
+    def _leave(self):
+        with self._cond:
+            self._active -= 1
+            if self._active == 0:
+                self._cond.notify_all()
+
+    def pause(self):
+        """
+        Block new requests and wait for the requests in flight.
+        :return:
+        """
+        with self._cond:
+            while self._paused:
+                self._cond.wait()
+            self._paused = True
+            while self._active > 0:
+                self._cond.wait()
+
+    def resume(self):
+        """
+        Let requests in again.
+        :return:
+        """
+        with self._cond:
+            if not self._paused:
+                raise RuntimeError('resume() called without pause()')
+            self._paused = False
+            self._cond.notify_all()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  _
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  _
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  _
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : notification_bus.py
+
+@Author     : hsn
+
+@Date       : 10/18/26 4:26 PM
+
+@Version    : 1.0.0
+"""
+import logging
+import threading
+from typing import Callable, Dict, List
+
+
+class NotificationBus:
+    """
+    An in-process publish/subscribe bus.
+    Callbacks run in the thread of the publisher, so they should only hand the work over (e.g. to an event loop).
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable]] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def subscribe(self, topic: str, callback: Callable):
+        """
+        Subscribe to a topic.
+        :param topic: The topic.
+        :param callback: Called with the arguments of `publish`.
+        :return:
+        """
+        with self._lock:
+            self._subscribers[topic] = self._subscribers.get(topic, []) + [callback]
+
+    def unsubscribe(self, topic: str, callback: Callable):
+        """
+        Unsubscribe from a topic.
+        :param topic: The topic.
+        :param callback: The callback passed to `subscribe`.
+        :return:
+        """
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, []))
+            if callback in callbacks:
+                callbacks.remove(callback)
+            self._subscribers[topic] = callbacks
+
+    def publish(self, topic: str, *args, **kwargs):
+        """
+        Publish to a topic.
+        :param topic: The topic.
+        :return:
+        """
+        # the list is replaced rather than changed, so it can be read without the lock
+        for callback in self._subscribers.get(topic, []):
+            try:
+                callback(*args, **kwargs)
+            except Exception as err:
+                self.logger.exception(err)
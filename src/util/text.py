@@ -58,6 +58,15 @@ def pascal_case_to_under_score(name) -> str:
     return ''.join(temp())
 
 
+def is_service_id(id_: Any) -> bool:
+    """
+    Checks if an ID belongs to a service account, such as '0sAccount'.
+    :param id_: The ID to check.
+    :return: True if the ID is a service account ID, False otherwise.
+    """
+    return isinstance(id_, str) and len(id_) >= 2 and id_[0] in string.digits and id_[1] == 's'
+
+
 def msg_process(msg: Any) -> dict:
     """
     Processes a message, escaping text messages and raising an error if the message chain is empty.
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : db_adapters.py
+
+@Author     : hsn
+
+@Date       : 10/19/26 0:48 AM
+
+@Version    : 1.0.0
+
+Compare the embedded database adapters on the operations of the server: inserting events, looking up accounts by
+user_id, updating them through `enter_one`, fetching a todo list with `find_many` and dropping expired events.
+Run it from the root of the project:
+
+    python tools/benchmark/db_adapters.py --adapters Zo Sqlite Lmdb --docs 5000
+"""
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path.cwd().as_posix())
+
+from src.dynamic_obj_loader import DynamicObjLoader  # noqa: E402
+from src.util.config_parser import ConfigParser  # noqa: E402
+from src.util.text import pascal_case_to_under_score  # noqa: E402
+
+
+def create_dba(name: str, path: str):
+    config = ConfigParser('config.json')
+    config.data['db']['adapters'].setdefault(name, {})['path'] = path
+    dol = DynamicObjLoader()
+    dol.add_path_to_group("db_adapters", Path.cwd() / 'src/db_adapter/adapters')
+    return dol.load_obj_from_group(pascal_case_to_under_score(name), group='db_adapters')(config=config)
+
+
+def timed(ops: int, func) -> float:
+    start = time.perf_counter()
+    func()
+    return ops / (time.perf_counter() - start)
+
+
+def bench(name: str, docs: int, threads: int) -> dict:
+    path = tempfile.mkdtemp()
+    dba = create_dba(name, path)
+    account, event = dba['account'], dba['event']
+    user_ids = [f'user{i}' for i in range(docs)]
+    rids = [f'rid{i}' for i in range(docs)]
+    now = time.time()
+    results = {}
+    try:
+        results['insert'] = timed(docs, lambda: [
+            account.insert_one({'user_id': u, 'todo_list': [], 'friend_dict': {}}) for u in user_ids])
+        results['insert events'] = timed(docs, lambda: event.insert_many(
+            [{'rid': r, 'time': now - (i % 2) * 3600, 'msg': 'x' * 64} for i, r in enumerate(rids)]))
+
+        sample = random.sample(user_ids, min(docs, 1000))
+        results['find_one'] = timed(len(sample), lambda: [account.find_one({'user_id': u}) for u in sample])
+
+        def update(users):
+            for u in users:
+                with account.enter_one({'user_id': u}) as i:
+                    i.data['todo_list'].append(u)
+
+        def update_parallel():
+            workers = [threading.Thread(target=update, args=(sample[i::threads],)) for i in range(threads)]
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+
+        results['enter_one'] = timed(len(sample), lambda: update(sample))
+        results[f'enter_one x{threads}'] = timed(len(sample), update_parallel)
+
+        pages = [random.sample(rids, 50) for _ in range(100)]
+        results['find_many(50)'] = timed(len(pages), lambda: [list(event.find_many('rid', p)) for p in pages])
+
+        event.set_ttl('time', 1800)
+        results['delete_expired'] = timed(1, event.delete_expired)
+    finally:
+        dba.close()
+        shutil.rmtree(path, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--adapters', nargs='+', default=['Zo', 'Sqlite'])
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    results = {name: bench(name, args.docs, args.threads) for name in args.adapters}
+    ops = list(next(iter(results.values())))
+    print(f'{"op/s":>16}' + ''.join(f'{name:>12}' for name in args.adapters))
+    for op in ops:
+        print(f'{op:>16}' + ''.join(f'{results[name][op]:>12.1f}' for name in args.adapters))
+
+
+if __name__ == '__main__':
+    main()
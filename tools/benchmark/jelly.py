@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : jelly.py
+
+@Author     : hsn
+
+@Date       : 10/19/26 4:05 AM
+
+@Version    : 1.0.0
+
+Compare `jelly_dump` and `jelly_load` of a user and a group with the per-class schemas against the old way, which
+ran `dir` on every instance. Run it from the root of the project:
+
+    python tools/benchmark/jelly.py --number 20000
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, Path.cwd().as_posix())
+
+from src.containers import Group, User  # noqa: E402
+from src.util.config_parser import ConfigParser  # noqa: E402
+from src.util.jelly import UserSet, jelly_dump, jelly_load  # noqa: E402
+
+
+def old_dump(obj) -> dict:
+    state = {k: getattr(obj, k) for k in dir(obj) if not k.startswith('__') and not callable(getattr(obj, k))}
+    return {'_obj_type': f'{obj.__module__}.{obj.__class__.__name__}',
+            **{k: {"_obj_type": ".UserSet", "data": list(v)} if isinstance(v, (set, UserSet)) else v
+               for k, v in state.items()}}
+
+
+def old_load(d: dict):
+    module_name, class_name = d['_obj_type'].rsplit('.', 1)
+    class_ = getattr(__import__(module_name, fromlist=[class_name]), class_name) if module_name else UserSet
+    obj = class_.__new__(class_)
+    obj._var_init()
+    for k, v in d.items():
+        if isinstance(v, dict) and "_obj_type" in v:
+            v = old_load(v)
+        setattr(obj, k, v)
+    return obj
+
+
+def create_objects(friends: int):
+    config = ConfigParser({'method': 'scrypt', 'kwargs': {'salt_length': 16, 'n': 1024, 'r': 8, 'p': 1, 'maxmem': 0}})
+    user = User('user0', 'password', 'User', config)
+    user._id = '0' * 32
+    group = Group('group0')
+    group._id = '1' * 32
+    for i in range(friends):
+        user.friend_dict[f'user{i}'] = {'nick': f'user{i}', 'time': 0.0}
+        user.todo_list.append(f'rid{i}')
+        group.member_dict[f'user{i}'] = {'nick': f'user{i}'}
+        group.admin_list.add(f'user{i}')
+    return user, group
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--friends', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{"us/op":>16}{"old":>12}{"new":>12}{"speedup":>12}')
+    for obj in create_objects(args.friends):
+        d = jelly_dump(obj)
+        assert d == old_dump(obj)
+        for op, old, new in (('dump', lambda: old_dump(obj), lambda: jelly_dump(obj)),
+                             ('load', lambda: old_load(d), lambda: jelly_load(d))):
+            t_old = timeit.timeit(old, number=args.number) / args.number * 1e6
+            t_new = timeit.timeit(new, number=args.number) / args.number * 1e6
+            name = f'{type(obj).__name__} {op}'
+            print(f'{name:>16}{t_old:>12.2f}{t_new:>12.2f}{t_old / t_new:>11.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+#  Copyright (C) 2023. HCAT-Project-Team
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+@File       : request_concurrency.py
+
+@Author     : hsn
+
+@Date       : 10/18/26 3:02 PM
+
+@Version    : 1.0.0
+
+Measure the request throughput of a receiver with 1..N concurrent clients, with the old global request lock and with
+the per-entity locks. Run it from the root of the project:
+
+    python tools/benchmark/request_concurrency.py --clients 1 2 4 8 --latency 2
+"""
+import argparse
+import sys
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+
+sys.path.insert(0, Path.cwd().as_posix())
+
+from src.containers import Request  # noqa: E402
+from src.dynamic_obj_loader import DynamicObjLoader  # noqa: E402
+from src.request_receiver.base_receiver import BaseReceiver  # noqa: E402
+from src.server import Server  # noqa: E402
+from src.util.config_parser import ConfigParser  # noqa: E402
+
+
+class BenchReceiver(BaseReceiver):
+    def _start(self):
+        ...
+
+
+class GlobalLockReceiver(BenchReceiver):
+    """
+    The behaviour before the per-entity locks: one request at a time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+
+    def create_req(self, req=None):
+        with self.lock:
+            return super().create_req(req)
+
+
+def add_latency(ca, latency: float):
+    """
+    Emulate the round-trip of a networked database.
+    """
+    for name in ('find', 'find_one', 'insert_one', 'update_one', 'delete_one'):
+        func = getattr(ca, name)
+
+        def wrapper(*args, __func=func, **kwargs):
+            time.sleep(latency)
+            return __func(*args, **kwargs)
+
+        setattr(ca, name, wraps(func)(wrapper))
+
+
+def create_server(latency: float) -> Server:
+    config = ConfigParser('config.json').data
+    config['db']['use'] = 'Zo'
+    config['db']['adapters']['Zo']['path'] = None  # in memory
+    config['crypto']['password']['kwargs']['n'] = 1024
+
+    dol = DynamicObjLoader()
+    dol.add_path_to_group("auxiliary_events", Path.cwd() / 'src/event/auxiliary_events')
+    dol.add_path_to_group("req_events", Path.cwd() / 'src/event/events')
+    dol.add_path_to_group("db_adapters", Path.cwd() / 'src/db_adapter/adapters')
+
+    server = Server(config=config, dol=dol, name='benchmark')
+    server.start()
+    if latency > 0:
+        for ca in (server.db_account, server.db_event, server.db_group):
+            add_latency(ca, latency)
+    return server
+
+
+def run(receiver: BaseReceiver, tokens: list, clients: int, requests: int) -> float:
+    def client(token):
+        for _ in range(requests):
+            receiver.create_req(Request(path='account/get_todo_list', headers={'Authorization': token}))
+
+    threads = [threading.Thread(target=client, args=(tokens[i],)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return clients * requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=50, help='requests per client')
+    parser.add_argument('--latency', type=float, default=2, help='emulated database latency in ms')
+    args = parser.parse_args()
+
+    server = create_server(args.latency / 1000)
+
+    # create one user per client
+    tokens = []
+    for i in range(max(args.clients)):
+        user_id = f'bench_user{i}'
+        server.request_handler(Request(path='account/register',
+                                       data={'user_id': user_id, 'password': '12345678', 'username': user_id}))
+        rt = server.request_handler(Request(path='account/login', data={'user_id': user_id, 'password': '12345678'}))
+        tokens.append(rt.json_data['token'])
+
+    try:
+        print(f'{"clients":>8} {"global lock(req/s)":>20} {"entity locks(req/s)":>20} {"speedup":>8}')
+        for clients in args.clients:
+            old = run(GlobalLockReceiver(server.request_handler), tokens, clients, args.requests)
+            new = run(BenchReceiver(server.request_handler), tokens, clients, args.requests)
+            print(f'{clients:>8} {old:>20.1f} {new:>20.1f} {new / old:>7.2f}x')
+    finally:
+        server.close()
+        Path('benchmark.key').unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    main()